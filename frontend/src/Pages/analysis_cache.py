@@ -0,0 +1,121 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+
+def normalize_handle(channel):
+    """The key a channel is cached under: "@Name", "name " and "NAME" are one channel"""
+    handle = str(channel or '').strip().lstrip('@').strip().lower()
+    if not handle:
+        raise ValueError("A channel handle is required")
+    return handle
+
+
+class AnalysisCache:
+    """Channel analyses by handle, kept in SQLite so they outlive restarts.
+
+    An analysis younger than `ttl` seconds is served as is. One up to `max_stale` seconds past
+    that is still served at once, while a single background refresh per channel replaces it;
+    anything older is analyzed again on the request. Failed analyses are never cached, nor
+    results `cacheable(result)` turns down, which are returned once and analyzed again next time.
+    """
+
+    def __init__(self, path, ttl=6 * 3600, max_stale=7 * 24 * 3600, on_error=None, cacheable=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.on_error = on_error
+        self.cacheable = cacheable
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS analyses '
+                            '(handle TEXT PRIMARY KEY, result TEXT NOT NULL, fetched_at REAL NOT NULL)')
+            pruned = self.db.execute('DELETE FROM analyses WHERE fetched_at < ?',
+                                     (time.time() - ttl - max_stale,)).rowcount
+        self.refreshing = set()
+        self.counts = {"hit": 0, "stale": 0, "miss": 0, "not_cached": 0, "refreshed": 0, "refresh_failed": 0,
+                       "pruned": pruned}
+        self.last_error = None
+
+    def read(self, handle):
+        with self.lock:
+            row = self.db.execute('SELECT result, fetched_at FROM analyses WHERE handle = ?', (handle,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, None)
+
+    def write(self, handle, result, fetched_at):
+        """Store `result`; False when it is not cacheable and was left out"""
+        if self.cacheable is not None and not self.cacheable(result):
+            self.count("not_cached")
+            return False
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO analyses VALUES (?, ?, ?)',
+                            (handle, json.dumps(result), fetched_at))
+        return True
+
+    def count(self, outcome):
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def get(self, channel, analyze, refresh=False):
+        """(result, cache fields) for a channel; `analyze(handle)` produces a result when needed,
+        given the normalized handle rather than the spelling the caller used"""
+        handle = normalize_handle(channel)
+        result, fetched_at = (None, None) if refresh else self.read(handle)
+        now = time.time()
+        age = now - fetched_at if result is not None else None
+        if age is not None and age <= self.ttl:
+            outcome = "hit"
+        elif age is not None and age <= self.ttl + self.max_stale:
+            outcome = "stale"
+            self.refresh(handle, analyze)
+        else:
+            outcome = "miss"
+            result, fetched_at = analyze(handle), now
+            self.write(handle, result, fetched_at)
+        self.count(outcome)
+        return result, {
+            "cache": outcome,
+            "dataAgeSeconds": round(time.time() - fetched_at, 1),
+            "fetchedAt": datetime.fromtimestamp(fetched_at).isoformat(timespec='seconds'),
+        }
+
+    def refresh(self, handle, analyze):
+        with self.lock:
+            if handle in self.refreshing:
+                return
+            self.refreshing.add(handle)
+        threading.Thread(target=self.run_refresh, args=(handle, analyze),
+                         name='cache-refresh', daemon=True).start()
+
+    def run_refresh(self, handle, analyze):
+        try:
+            fetched_at = time.time()
+            # A result that is not cacheable leaves the stale one in place, like a failure
+            self.count("refreshed" if self.write(handle, analyze(handle), fetched_at) else "refresh_failed")
+        except Exception as e:
+            # The stale analysis stays; the next request past the TTL tries again
+            self.count("refresh_failed")
+            self.last_error = f"{handle}: {e}"
+            if self.on_error is not None:
+                self.on_error(e)
+        finally:
+            with self.lock:
+                self.refreshing.discard(handle)
+
+    def stats(self):
+        with self.lock:
+            entries, oldest = self.db.execute('SELECT COUNT(*), MIN(fetched_at) FROM analyses').fetchone()
+            return {
+                "path": self.path,
+                "ttl_seconds": self.ttl,
+                "max_stale_seconds": self.max_stale,
+                "entries": entries,
+                "oldest_seconds": round(time.time() - oldest, 1) if oldest is not None else None,
+                "refreshing": len(self.refreshing),
+                **self.counts,
+                "last_error": self.last_error,
+            }
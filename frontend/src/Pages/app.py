@@ -1,87 +1,422 @@
 from flask import Flask, request, jsonify
-import pandas as pd
+import os
 import numpy as np
-import joblib
+import pandas as pd
 from flask_cors import CORS
+from functools import partial
+from catalog import FEATURES, FILTERED_OUT_MESSAGE, NO_MATCH_MESSAGE, CatalogReloader, load_catalog
+from snapshot import load_snapshot, snapshot_manifest_path
+from partition_store import load_partitioned, store_manifest_path
+from recommend_cache import ResponseCache
+from range_index import parse_filters
+from portfolio import PRICE_COLUMNS, optimize, prices
+from leaderboards import Leaderboards
+from coalesce import MicroBatcher, SingleFlight
+from delta_log import DeltaTailer
+from shards import parse_shard
+from metrics import Metrics
+from serialization import records, respond
+from procfs import worker_report
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all domains - allow React frontend to call this API
+metrics = Metrics('recommender').instrument(app)
 
-# Load data and model once
-data = pd.read_csv('final.csv')
+DATA_PATH = os.environ.get('RECOMMEND_DATA_PATH', 'final.csv')
+MODEL_PATH = os.environ.get('RECOMMEND_MODEL_PATH', 'creator_recommendation_model.joblib')
+# Directory written by `python snapshot.py build`; when set it replaces the CSV + joblib load
+SNAPSHOT_PATH = os.environ.get('RECOMMEND_SNAPSHOT_PATH')
+# Directory written by `python partition_store.py build`, for catalogs larger than memory
+PARTITIONED_PATH = os.environ.get('RECOMMEND_PARTITIONED_PATH')
+# Upper bound on creator rows kept resident from the partitioned store
+PARTITION_CACHE_ROWS = int(os.environ.get('RECOMMEND_PARTITION_CACHE_ROWS', 2_000_000))
+RELOAD_INTERVAL = float(os.environ.get('RECOMMEND_RELOAD_INTERVAL', 5))
+# Memory for earnings regions, which are built per partition on first use and dropped least recently used first
+REGIONS_MAX_BYTES = int(float(os.environ.get('RECOMMEND_REGIONS_MAX_MB', 256)) * 1024 * 1024)
+# Serve one slice of the catalog behind router.py, e.g. RECOMMEND_SHARD=0/4; RECOMMEND_SHARD_BY is country or creator
+SHARD = parse_shard(os.environ['RECOMMEND_SHARD'], os.environ.get('RECOMMEND_SHARD_BY', 'country')) if os.environ.get('RECOMMEND_SHARD') else None
+if SHARD is not None and (PARTITIONED_PATH or os.environ.get('RECOMMEND_DELTA_LOG')):
+    raise ValueError("RECOMMEND_SHARD is not supported with RECOMMEND_PARTITIONED_PATH or RECOMMEND_DELTA_LOG")
 
-def convert_views_to_number(view_str):
-    if isinstance(view_str, str):
-        view_str = view_str.strip()
-        try:
-            if view_str[-1] == 'B':
-                return float(view_str[:-1]) * 1e9
-            elif view_str[-1] == 'M':
-                return float(view_str[:-1]) * 1e6
-            elif view_str[-1] == 'K':
-                return float(view_str[:-1]) * 1e3
-            else:
-                return float(view_str.replace(',', ''))
-        except Exception:
-            return np.nan
-    else:
-        return view_str
-
-data['video_views'] = data['video_views'].apply(convert_views_to_number)
-
-model = joblib.load('creator_recommendation_model.joblib')
+if PARTITIONED_PATH:
+    reloader = CatalogReloader(partial(load_partitioned, PARTITIONED_PATH, PARTITION_CACHE_ROWS),
+                               [store_manifest_path(PARTITIONED_PATH)], RELOAD_INTERVAL)
+elif SNAPSHOT_PATH:
+    reloader = CatalogReloader(partial(load_snapshot, SNAPSHOT_PATH, shard=SHARD, regions_max_bytes=REGIONS_MAX_BYTES), [snapshot_manifest_path(SNAPSHOT_PATH)], RELOAD_INTERVAL)
+else:
+    reloader = CatalogReloader(partial(load_catalog, DATA_PATH, MODEL_PATH, shard=SHARD, regions_max_bytes=REGIONS_MAX_BYTES), [DATA_PATH, MODEL_PATH], RELOAD_INTERVAL)
+if os.environ.get('RECOMMEND_HOT_RELOAD', '1') == '1':
+    reloader.start()
+
+# Append-only JSONL log of creator updates (see delta_log.py), applied without a reload. With a
+# snapshot the applied changes are compacted into a new snapshot build every RECOMMEND_COMPACT_INTERVAL s
+DELTA_LOG = os.environ.get('RECOMMEND_DELTA_LOG')
+deltas = None
+if DELTA_LOG:
+    if PARTITIONED_PATH:
+        raise ValueError("RECOMMEND_DELTA_LOG is not supported with RECOMMEND_PARTITIONED_PATH")
+    deltas = DeltaTailer(reloader, DELTA_LOG, float(os.environ.get('RECOMMEND_DELTA_INTERVAL', 1)),
+                         SNAPSHOT_PATH, float(os.environ.get('RECOMMEND_COMPACT_INTERVAL', 300)))
+    # Start from everything logged so far, not from the base alone
+    deltas.poll()
+    if os.environ.get('RECOMMEND_HOT_RELOAD', '1') == '1':
+        deltas.start()
+
+cache = ResponseCache(
+    max_entries=int(os.environ.get('RECOMMEND_CACHE_SIZE', 1024)),
+    ttl_seconds=float(os.environ.get('RECOMMEND_CACHE_TTL', 300)),
+    bucketing=os.environ.get('RECOMMEND_CACHE_BUCKETING', '0') == '1',
+)
+
+OUTPUT_COLUMNS = [
+    'youtuber', 'predicted_earning', 'subscribers',
+    'video_views', 'country', 'channel_type'
+]
+# The router breaks ties between shards by position in the full catalog
+if SHARD is not None:
+    OUTPUT_COLUMNS.append('catalog_row')
+
+PORTFOLIO_COLUMNS = OUTPUT_COLUMNS + ['price']
+
+SIMILAR_COLUMNS = [
+    'youtuber', 'distance', 'subscribers',
+    'video_views', 'country', 'channel_type'
+]
+
+TOP_K = 5
+# Largest top_k a /recommend/batch request may ask for
+MAX_TOP_K = 100
+MAX_SIMILAR = 100
+
+# Top-k tables for every (country, channel_type, budget bucket), rebuilt after each reload. Not with
+# the partitioned store: building them would load every partition and undo its memory bound.
+leaderboards = Leaderboards(
+    OUTPUT_COLUMNS, TOP_K,
+    min_views=[float(v) for v in os.environ.get('RECOMMEND_LEADERBOARD_MIN_VIEWS', '0').split(',')],
+)
+if os.environ.get('RECOMMEND_LEADERBOARDS', '1') == '1' and not PARTITIONED_PATH:
+    leaderboards.start(reloader)
+
+# Identical concurrent misses share one computation; set RECOMMEND_SINGLE_FLIGHT=0 to compute each
+flights = SingleFlight() if os.environ.get('RECOMMEND_SINGLE_FLIGHT', '1') == '1' else None
+# Window in ms for gathering different concurrent model calls into one predict; 0 turns it off
+MICRO_BATCH_MS = float(os.environ.get('RECOMMEND_MICRO_BATCH_MS', 0))
+batcher = MicroBatcher(MICRO_BATCH_MS / 1000, int(os.environ.get('RECOMMEND_MICRO_BATCH_MAX', 64))) if MICRO_BATCH_MS > 0 else None
+MAX_BATCH_SIZE = 500
+
+def after_fork():
+    """Called by serve.py in each new worker: threads started before the fork do not run in it"""
+    leaderboards.after_fork()
+    if deltas is not None:
+        deltas.after_fork()
+    catalog = reloader.current
+    if catalog.regions is not None and hasattr(catalog.regions.partitions, 'after_fork'):
+        catalog.regions.partitions.after_fork()
+    if catalog.similar is not None:
+        getattr(catalog.similar, 'index', catalog.similar).after_fork()
+
+def parse_brief(content):
+    brand_budget_usd = content.get('brand_budget_usd')
+    country = content.get('country')
+    product_category = content.get('product_category')
+    min_views_required = content.get('min_views_required')
+
+    if None in [brand_budget_usd, country, product_category, min_views_required]:
+        return None
+    if not isinstance(country, str) or not isinstance(product_category, str):
+        raise TypeError("country and product_category must be strings")
+    try:
+        return cache.normalize(brand_budget_usd, country, product_category, min_views_required)
+    except (TypeError, ValueError):
+        raise ValueError("brand_budget_usd and min_views_required must be numbers") from None
+
+def partition_key(brief):
+    _, country, product_category, _ = brief
+    return country.lower(), product_category.lower()
+
+def candidates_for(catalog, brief, filters=()):
+    """The partition's creators that pass the range filters, and their block positions (None when unfiltered)"""
+    brand_budget_usd, _, _, min_views_required = brief
+    key = partition_key(brief)
+    block = catalog.partitions.get(key)
+    if block is None:
+        return None, None
+    positions = None
+    if filters:
+        positions = catalog.ranges.positions(key, filters)
+        block = block.iloc[positions]
+    return block.assign(brand_budget_usd=brand_budget_usd, min_views_required=min_views_required), positions
+
+def no_match(candidates):
+    return NO_MATCH_MESSAGE if candidates is None else FILTERED_OUT_MESSAGE
+
+def leaderboard(catalog, brief, filters, k=TOP_K):
+    # Range filters change the candidate set, so only unfiltered briefs can use the tables
+    if filters:
+        return None
+    return leaderboards.lookup(catalog, partition_key(brief), brief[0], brief[3], k)
+
+def uses_regions(catalog, brief):
+    return catalog.regions is not None and np.isfinite(brief[0]) and np.isfinite(brief[3])
+
+def predict(catalog, brief, candidates, positions=None):
+    # Precomputed per-creator regions answer without a model call when the model is a compilable tree
+    if uses_regions(catalog, brief):
+        return catalog.regions.predict(partition_key(brief), brief[0], brief[3], positions)
+    if batcher is not None:
+        return batcher.predict(catalog.model, candidates[FEATURES])
+    return catalog.model.predict(candidates[FEATURES])
+
+def rank(candidates, k=TOP_K):
+    with metrics.stage('sort'):
+        # Stable sort keeps catalog order among tied predictions, so batch and single results agree
+        top = candidates.sort_values(by='predicted_earning', ascending=False, kind='mergesort').head(k)
+    # Rows to dicts; 'serialize' is the JSON encoding of the whole response
+    with metrics.stage('records'):
+        return records(top, OUTPUT_COLUMNS)
+
+def compute_recommendation(catalog, brief, filters):
+    with metrics.stage('filter'):
+        filtered, positions = candidates_for(catalog, brief, filters)
+
+    if filtered is None or filtered.empty:
+        return {"top_creators": [], "message": no_match(filtered), "version": catalog.version}
+    # Predict expected earnings
+    with metrics.stage('predict'):
+        filtered['predicted_earning'] = predict(catalog, brief, filtered, positions)
+    return {"top_creators": rank(filtered), "version": catalog.version}
 
 @app.route('/recommend', methods=['POST'])
 def recommend():
     try:
         content = request.json
-        brand_budget_usd = content.get('brand_budget_usd')
-        country = content.get('country')
-        product_category = content.get('product_category')
-        min_views_required = content.get('min_views_required')
 
         # Validate inputs
-        if None in [brand_budget_usd, country, product_category, min_views_required]:
+        try:
+            brief = parse_brief(content)
+            filters = parse_filters(content)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        if brief is None:
             return jsonify({"error": "Missing input parameters"}), 400
 
-        filtered = data[
-            (data['country'].str.lower() == country.lower()) &
-            (data['channel_type'].str.lower() == product_category.lower())
-        ].copy()
+        # Pin one catalog version for the whole request; a concurrent reload swaps in the next one
+        catalog = reloader.current
+        key = cache.key(brief, TOP_K, filters)
+        body = cache.get(key, catalog.version)
+        if body is not None:
+            return respond(body, 200, {"X-Cache": "HIT"})
 
-        if filtered.empty:
-            return jsonify({"top_creators": [], "message": "No creators found for this country and product category"}), 200
+        top = leaderboard(catalog, brief, filters)
+        if top is not None:
+            body = {"top_creators": top, "version": catalog.version}
+            cache.put(key, body, catalog.version)
+            return respond(body, 200, {"X-Cache": "LEADERBOARD"})
 
-        filtered['brand_budget_usd'] = brand_budget_usd
-        filtered['min_views_required'] = min_views_required
+        shared = False
+        if flights is not None:
+            body, shared = flights.run((key, catalog.version), partial(compute_recommendation, catalog, brief, filters))
+        else:
+            body = compute_recommendation(catalog, brief, filters)
 
-        features = [
-            'subscribers', 'video_views', 'video_views_for_the_last_30_days',
-            'country', 'product_category', 'brand_budget_usd', 'min_views_required'
-        ]
+        if not shared:
+            cache.put(key, body, catalog.version)
+        with metrics.stage('serialize'):
+            return respond(body, 200, {"X-Cache": "COALESCED" if shared else "MISS"})
 
-        X_candidates = filtered[features]
+    except Exception as e:
+        metrics.count_error(e)
+        return jsonify({"error": str(e)}), 500
 
-        # Predict expected earnings
-        predicted_earnings = model.predict(X_candidates)
-        filtered['predicted_earning'] = predicted_earnings
+def batch_result(body):
+    # The batch reports its catalog version once, not per brief
+    return {name: value for name, value in body.items() if name != 'version'}
 
-        top_5 = filtered.sort_values(by='predicted_earning', ascending=False).head(5)
+def cache_batch_result(key, result, catalog):
+    """Cache a batch brief's answer in the shape /recommend caches it, and return it for the batch"""
+    cache.put(key, {**result, "version": catalog.version}, catalog.version)
+    return result
+
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    try:
+        content = request.json
+        briefs = content.get('briefs')
+        k = content.get('top_k', TOP_K)
 
-        # Select and format output fields
-        result = top_5[[
-            'youtuber', 'predicted_earning', 'subscribers',
-            'video_views', 'country', 'channel_type'
-        ]].copy()
+        if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= MAX_TOP_K:
+            return jsonify({"error": f"top_k must be an integer between 1 and {MAX_TOP_K}"}), 400
+        if not isinstance(briefs, list) or not briefs:
+            return jsonify({"error": "briefs must be a non-empty list"}), 400
+        if len(briefs) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} briefs per batch"}), 400
 
-        # Convert to list of dicts
-        top_creators = result.to_dict(orient='records')
+        catalog = reloader.current
+        results = [None] * len(briefs)
+        keys = {}
+        blocks = []
+        for i, item in enumerate(briefs):
+            try:
+                brief = parse_brief(item) if isinstance(item, dict) else None
+                filters = parse_filters(item) if brief is not None else ()
+            except (TypeError, ValueError) as e:
+                results[i] = {"error": str(e)}
+                continue
+            if brief is None:
+                results[i] = {"error": "Missing input parameters"}
+                continue
+            keys[i] = cache.key(brief, k, filters)
+            body = cache.get(keys[i], catalog.version)
+            if body is not None:
+                results[i] = batch_result(body)
+                continue
+            top = leaderboard(catalog, brief, filters, k)
+            if top is not None:
+                results[i] = cache_batch_result(keys[i], {"top_creators": top}, catalog)
+                continue
+            with metrics.stage('filter'):
+                candidates, positions = candidates_for(catalog, brief, filters)
+            if candidates is None or candidates.empty:
+                results[i] = cache_batch_result(keys[i], {"top_creators": [], "message": no_match(candidates)}, catalog)
+                continue
+            if uses_regions(catalog, brief):
+                with metrics.stage('predict'):
+                    candidates['predicted_earning'] = predict(catalog, brief, candidates, positions)
+                results[i] = cache_batch_result(keys[i], {"top_creators": rank(candidates, k)}, catalog)
+                continue
+            blocks.append(candidates.assign(brief=i))
 
-        return jsonify({"top_creators": top_creators}), 200
+        if blocks:
+            # One feature matrix and one predict call for every brief the regions cannot answer
+            combined = pd.concat(blocks)
+            with metrics.stage('predict'):
+                combined['predicted_earning'] = catalog.model.predict(combined[FEATURES])
+            for i, candidates in combined.groupby('brief', sort=False):
+                results[i] = cache_batch_result(keys[i], {"top_creators": rank(candidates, k)}, catalog)
+
+        with metrics.stage('serialize'):
+            return respond({"results": results, "version": catalog.version})
 
     except Exception as e:
+        metrics.count_error(e)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/recommend/portfolio', methods=['POST'])
+def recommend_portfolio():
+    try:
+        content = request.json
+        price_band = content.get('price_band', 'low')
+
+        try:
+            brief = parse_brief(content)
+            filters = parse_filters(content)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        if brief is None:
+            return jsonify({"error": "Missing input parameters"}), 400
+        if price_band not in PRICE_COLUMNS:
+            return jsonify({"error": f"price_band must be one of {sorted(PRICE_COLUMNS)}"}), 400
+
+        catalog = reloader.current
+        with metrics.stage('filter'):
+            candidates, positions = candidates_for(catalog, brief, filters)
+        if candidates is None or candidates.empty:
+            return respond({"portfolio": [], "message": no_match(candidates), "version": catalog.version})
+
+        with metrics.stage('predict'):
+            candidates['predicted_earning'] = predict(catalog, brief, candidates, positions)
+        candidates['price'] = prices(candidates, price_band)
+        # The brief's budget is what the whole set of creators has to fit in
+        with metrics.stage('solve'):
+            chosen, solver = optimize(candidates['predicted_earning'].to_numpy(), candidates['price'].to_numpy(), brief[0])
+        portfolio = candidates.iloc[chosen].sort_values(by='predicted_earning', ascending=False, kind='mergesort')
+
+        with metrics.stage('serialize'):
+            return respond({
+                "portfolio": records(portfolio, PORTFOLIO_COLUMNS),
+                "total_price": float(portfolio['price'].sum()),
+                "total_predicted_earning": float(portfolio['predicted_earning'].sum()),
+                "budget": brief[0],
+                "solver": solver,
+                "candidates": len(candidates),
+                "version": catalog.version,
+            })
+
+    except Exception as e:
+        metrics.count_error(e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/similar', methods=['POST'])
+def similar():
+    try:
+        content = request.json
+        youtuber = content.get('youtuber')
+        k = content.get('k', TOP_K)
+
+        if not youtuber:
+            return jsonify({"error": "Missing youtuber"}), 400
+        if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= MAX_SIMILAR:
+            return jsonify({"error": f"k must be an integer between 1 and {MAX_SIMILAR}"}), 400
+
+        catalog = reloader.current
+        if catalog.similar is None:
+            return jsonify({"error": "Similar-creators search needs the in-memory catalog"}), 501
+        with metrics.stage('search'):
+            found = catalog.similar.similar(youtuber, k)
+        if found is None:
+            return jsonify({"error": f"Unknown creator: {youtuber}"}), 404
+
+        rows, distances = found
+        with metrics.stage('serialize'):
+            top = catalog.data.iloc[rows].assign(distance=distances)
+            return respond({"similar_creators": records(top, SIMILAR_COLUMNS), "version": catalog.version})
+
+    except Exception as e:
+        metrics.count_error(e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/recommend/version', methods=['GET'])
+def recommend_version():
+    if SHARD is not None:
+        return jsonify({**reloader.status(), "shard": str(SHARD)}), 200
+    return jsonify(reloader.status()), 200
+
+@app.route('/recommend/workers', methods=['GET'])
+def recommend_workers():
+    # Set by serve.py's pre-fork master; a plain `python app.py` reports just this process
+    master = os.environ.get('RECOMMEND_PREFORK_MASTER')
+    if master is None:
+        return jsonify({"pid": os.getpid(), "master": None, "workers": []}), 200
+    return jsonify({"pid": os.getpid(), **worker_report(int(master))}), 200
+
+@app.route('/recommend/cache', methods=['GET'])
+def recommend_cache_stats():
+    return jsonify(cache.stats()), 200
+
+@app.route('/recommend/coalescing', methods=['GET'])
+def recommend_coalescing():
+    return jsonify({
+        "single_flight": flights.stats() if flights is not None else None,
+        "micro_batch": batcher.stats() if batcher is not None else None,
+    }), 200
+
+@app.route('/recommend/partitions', methods=['GET'])
+def recommend_partitions():
+    store = getattr(reloader.current, 'store', None)
+    if store is None:
+        return jsonify({"mode": "memory"}), 200
+    return jsonify({"mode": "partitioned", **store.stats()}), 200
+
+@app.route('/recommend/deltas', methods=['GET'])
+def recommend_deltas():
+    if deltas is None:
+        return jsonify({"log": None}), 200
+    return jsonify(deltas.stats()), 200
+
+@app.route('/recommend/leaderboards', methods=['GET'])
+def recommend_leaderboards():
+    return jsonify(leaderboards.stats()), 200
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
 
@@ -1,13 +1,80 @@
-from flask import Flask, request, jsonify
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
-import time, re
+from flask import Flask, Response, request, jsonify
+import os, re, json, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from flask_cors import CORS
+from analysis_cache import AnalysisCache, normalize_handle
+from browser_pool import BrowserPool, ChromeLauncher, PoolTimeout
+from http_extract import ExtractionError, HttpExtractor
+from page_ready import PageNotReady, wait_for_texts
+from metrics import Metrics
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
+metrics = Metrics('channel_analyzer').instrument(app)
+
+# "http" reads the channel pages' embedded JSON over pooled connections and only opens a browser
+# when a page does not parse; "selenium" always renders them in a browser
+ENGINE = os.environ.get('ANALYZE_ENGINE', 'http')
+if ENGINE not in ('http', 'selenium'):
+    raise ValueError(f"ANALYZE_ENGINE must be http or selenium, not {ENGINE!r}")
+YOUTUBE_URL = os.environ.get('ANALYZE_YOUTUBE_URL', 'https://www.youtube.com').rstrip('/')
+extractor = HttpExtractor(YOUTUBE_URL, timeout=float(os.environ.get('ANALYZE_HTTP_TIMEOUT', 10)))
+
+# Warm headless browsers shared by /analyze requests; each is replaced after ANALYZE_POOL_MAX_USES
+# analyses or once its processes pass ANALYZE_POOL_MAX_RSS_MB. With the http engine they are only
+# launched by the first fallback, which is also when chromedriver is first resolved.
+launcher = ChromeLauncher(os.environ.get('ANALYZE_DRIVER_CACHE', '.chromedriver.json'))
+pool = BrowserPool(
+    launcher,
+    size=int(os.environ.get('ANALYZE_POOL_SIZE', 2)),
+    max_uses=int(os.environ.get('ANALYZE_POOL_MAX_USES', 50)),
+    max_rss_mb=float(os.environ.get('ANALYZE_POOL_MAX_RSS_MB', 1024)),
+    wait_timeout=float(os.environ.get('ANALYZE_POOL_WAIT', 30)),
+)
+if ENGINE == 'selenium':
+    pool.start()
+
+# Finished analyses by channel handle: fresh for ANALYZE_CACHE_TTL seconds, then served stale while
+# a background refresh runs for up to ANALYZE_CACHE_MAX_STALE more. A browser analysis with a step
+# that timed out may have read a half-rendered page, so it is returned but not cached
+cache = AnalysisCache(
+    os.environ.get('ANALYZE_CACHE_PATH', 'analysis_cache.sqlite3'),
+    ttl=float(os.environ.get('ANALYZE_CACHE_TTL', 6 * 3600)),
+    max_stale=float(os.environ.get('ANALYZE_CACHE_MAX_STALE', 7 * 24 * 3600)),
+    on_error=metrics.count_error,
+    cacheable=lambda result: all(wait["ready"] for wait in result.get("waits", {}).values()),
+)
+
+# /analyze/batch runs at most ANALYZE_BATCH_CONCURRENCY analyses at once across all batches; one
+# running longer than ANALYZE_BATCH_TIMEOUT is reported as timed out and the batch moves on
+BATCH_CONCURRENCY = int(os.environ.get('ANALYZE_BATCH_CONCURRENCY', 8))
+BATCH_TIMEOUT = float(os.environ.get('ANALYZE_BATCH_TIMEOUT', 120))
+BATCH_MAX_CHANNELS = int(os.environ.get('ANALYZE_BATCH_MAX_CHANNELS', 500))
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='batch')
+
+# What each step reads, and how long it may wait for it before extracting whatever is there
+HEADER_XPATH = '//span[@class="yt-core-attributed-string yt-content-metadata-view-model-wiz__metadata-text yt-core-attributed-string--white-space-pre-wrap yt-core-attributed-string--link-inherit-color"]'
+VIDEO_META_XPATH = '//span[@class="inline-metadata-item style-scope ytd-video-meta-block"]'
+# Never longer than the fixed sleeps these waits replaced
+HOME_TIMEOUT = float(os.environ.get('ANALYZE_HOME_TIMEOUT', 3))
+VIDEOS_TIMEOUT = float(os.environ.get('ANALYZE_VIDEOS_TIMEOUT', 5))
+
+def header_ready(texts):
+    # The metadata row renders at once; a channel hiding its subscriber count or without uploads
+    # simply has no span for it, so waiting for both counts would run out the deadline
+    return any(text.strip() for text in texts)
+
+def latest_video_ready(texts):
+    # Views and upload date of the first video
+    return len(texts) >= 2 and all(texts[:2])
+
+def wait_step(driver, step, xpath, ready, timeout, waits):
+    with metrics.stage('wait'):
+        texts, seconds, done = wait_for_texts(driver, xpath, ready, timeout)
+    waits[step] = {"seconds": round(seconds, 3), "ready": done}
+    if not done:
+        metrics.count_error(PageNotReady(step))
+    return texts
 
 def parse_number(text):
     text = text.replace(",", "").lower()
@@ -29,78 +96,186 @@ def is_old_upload(date_text):
         return int(re.findall(r"\d+", date_text)[0]) > 25
     return False
 
-@app.route("/analyze", methods=["POST"])
-def analyze_channel():
-    data = request.get_json()
-    channel_name = data.get("channel")
-
-    home_url = f"https://www.youtube.com/@{channel_name}"
+def browser_fields(driver, channel_name, waits):
+    home_url = f"{YOUTUBE_URL}/@{channel_name}"
     videos_url = f"{home_url}/videos"
 
-    options = webdriver.ChromeOptions()
-    options.add_argument("--headless")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--log-level=3")
-    options.add_argument("--window-size=1920,1080")
-    options.add_experimental_option("excludeSwitches", ["enable-logging"])
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-
-    try:
-        # Step 1: Subscriber and video count
+    # Step 1: Subscriber and video count
+    with metrics.stage('navigate'):
         driver.get(home_url)
-        time.sleep(3)
-        spans = driver.find_elements(By.XPATH, '//span[@class="yt-core-attributed-string yt-content-metadata-view-model-wiz__metadata-text yt-core-attributed-string--white-space-pre-wrap yt-core-attributed-string--link-inherit-color"]')
-
+    spans = wait_step(driver, 'home', HEADER_XPATH, header_ready, HOME_TIMEOUT, waits)
+    with metrics.stage('extract'):
         subscriber_count = video_count = "Not Found"
         for span in spans:
-            text = span.text.lower()
+            text = span.lower()
             if "subscribers" in text:
-                subscriber_count = span.text
+                subscriber_count = span
             elif "videos" in text:
-                video_count = span.text
+                video_count = span
 
-        # Step 2: Latest video details
+    # Step 2: Latest video details
+    with metrics.stage('navigate'):
         driver.get(videos_url)
-        time.sleep(5)
-        metadata_items = driver.find_elements(By.XPATH, '//span[@class="inline-metadata-item style-scope ytd-video-meta-block"]')
-
-        latest_views = metadata_items[0].text if len(metadata_items) > 0 else "Not found"
-        latest_upload = metadata_items[1].text if len(metadata_items) > 1 else "Not found"
-
-        # Step 3: Fraud Detection
-        fraud_reasons = []
-        sub_count = parse_number(subscriber_count) if subscriber_count != "Not Found" else 0
-        vid_count = parse_number(video_count) if video_count != "Not Found" else 0
-        view_count = parse_number(latest_views) if latest_views != "Not found" else 0
-
-        if sub_count < 1000:
-            fraud_reasons.append("Subscribers < 1K")
-        if sub_count > 10_000 and vid_count < 5:
-            fraud_reasons.append("Too few videos for many subscribers")
-        if latest_upload != "Not found" and is_old_upload(latest_upload.lower()):
-            fraud_reasons.append("Latest upload is too old")
-        if sub_count > 0 and view_count / sub_count < 0.01:
-            fraud_reasons.append("Low views-to-subscribers ratio")
-        if sub_count > 0 and vid_count > 0 and (sub_count / vid_count) > 1_000_000:
-            fraud_reasons.append("Suspicious subscribers-to-videos ratio")
-
-        status = "Real Channel" if not fraud_reasons else f"Potentially Fraudulent: {', '.join(fraud_reasons)}"
-
-        driver.quit()
-
-        return jsonify({
-            "channel": channel_name,
-            "subscribers": subscriber_count,
-            "videos": video_count,
-            "latestViews": latest_views,
-            "latestUpload": latest_upload,
-            "status": status
-        })
+    metadata_items = wait_step(driver, 'videos', VIDEO_META_XPATH, latest_video_ready, VIDEOS_TIMEOUT, waits)
+    with metrics.stage('extract'):
+        latest_views = metadata_items[0] if len(metadata_items) > 0 else "Not found"
+        latest_upload = metadata_items[1] if len(metadata_items) > 1 else "Not found"
+
+    return {"subscribers": subscriber_count, "videos": video_count,
+            "latestViews": latest_views, "latestUpload": latest_upload}
+
+def scrape_with_browser(channel_name):
+    with metrics.stage('checkout'):
+        browser = pool.checkout()
+    # Until the page steps succeed the browser may be mid-load or wedged, so it is not reused
+    failed = True
+    waits = {}
+    try:
+        fields = browser_fields(browser.driver, channel_name, waits)
+        failed = False
+    finally:
+        pool.checkin(browser, failed)
+    return {**fields, "engine": "selenium", "waits": waits}
+
+def scrape_with_http(channel_name):
+    """The channel's fields without a browser, or None when its pages did not parse"""
+    try:
+        with metrics.stage('http_extract'):
+            fields = extractor.extract(channel_name)
+    except ExtractionError as e:
+        metrics.count_error(e)
+        return None
+    return {**fields, "engine": "http"}
+
+def assess(fields):
+    # Step 3: Fraud Detection
+    subscriber_count, video_count = fields["subscribers"], fields["videos"]
+    latest_views, latest_upload = fields["latestViews"], fields["latestUpload"]
+    fraud_reasons = []
+    sub_count = parse_number(subscriber_count) if subscriber_count != "Not Found" else 0
+    vid_count = parse_number(video_count) if video_count != "Not Found" else 0
+    view_count = parse_number(latest_views) if latest_views != "Not found" else 0
+
+    if sub_count < 1000:
+        fraud_reasons.append("Subscribers < 1K")
+    if sub_count > 10_000 and vid_count < 5:
+        fraud_reasons.append("Too few videos for many subscribers")
+    if latest_upload != "Not found" and is_old_upload(latest_upload.lower()):
+        fraud_reasons.append("Latest upload is too old")
+    if sub_count > 0 and view_count / sub_count < 0.01:
+        fraud_reasons.append("Low views-to-subscribers ratio")
+    if sub_count > 0 and vid_count > 0 and (sub_count / vid_count) > 1_000_000:
+        fraud_reasons.append("Suspicious subscribers-to-videos ratio")
+
+    return "Real Channel" if not fraud_reasons else f"Potentially Fraudulent: {', '.join(fraud_reasons)}"
+
+def analyze(channel_name):
+    fields = scrape_with_http(channel_name) if ENGINE == 'http' else None
+    if fields is None:
+        fields = scrape_with_browser(channel_name)
+    return {**fields, "status": assess(fields)}
+
+@app.route("/analyze", methods=["POST"])
+def analyze_channel():
+    data = request.get_json()
+    channel_name = data.get("channel")
+    try:
+        normalize_handle(channel_name)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # "refresh": true skips the cache and replaces its entry
+        result, cached = cache.get(channel_name, analyze, refresh=bool(data.get("refresh")))
+        return jsonify({"channel": channel_name, **result, **cached})
 
+    except PoolTimeout as e:
+        metrics.count_error(e)
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
-        driver.quit()
+        metrics.count_error(e)
         return jsonify({"error": str(e)}), 500
 
+def analyze_one(channel_name, refresh, started, index, submitted):
+    """One line of a batch: the analysis or its error, with how long it queued and ran"""
+    started[index] = time.monotonic()
+    with metrics.bound('/analyze/batch'):
+        try:
+            result, cached = cache.get(channel_name, analyze, refresh=refresh)
+            line = {"channel": channel_name, **result, **cached}
+        except Exception as e:
+            metrics.count_error(e)
+            line = {"channel": channel_name, "error": str(e), "errorType": type(e).__name__}
+    line["queuedSeconds"] = round(started[index] - submitted, 3)
+    line["seconds"] = round(time.monotonic() - started[index], 3)
+    return line
+
+def stream_batch(channels, concurrency, refresh):
+    """NDJSON lines, one per channel as soon as it finishes, then a summary"""
+    start = time.perf_counter()
+    todo = iter(enumerate(channels))
+    pending = {}
+    started = {}
+    counts = {"ok": 0, "errors": 0, "timeouts": 0}
+    try:
+        while True:
+            while len(pending) < concurrency:
+                item = next(todo, None)
+                if item is None:
+                    break
+                pending[batch_pool.submit(analyze_one, item[1], refresh, started, item[0], time.monotonic())] = item
+            if not pending:
+                break
+            # Wake for the first result or the first deadline; queued channels have none yet
+            deadlines = [started[index] + BATCH_TIMEOUT for index, _ in pending.values() if index in started]
+            timeout = min(deadlines, default=time.monotonic() + 1) - time.monotonic()
+            done, _ = wait(pending, timeout=min(max(timeout, 0), 1), return_when=FIRST_COMPLETED)
+            for future in done:
+                index, _ = pending.pop(future)
+                line = future.result()
+                counts["errors" if "error" in line else "ok"] += 1
+                yield json.dumps({"index": index, **line}) + "\n"
+            now = time.monotonic()
+            for future, (index, channel_name) in list(pending.items()):
+                if index in started and now - started[index] > BATCH_TIMEOUT:
+                    # Its worker stays busy until the scrape gives up; the batch does not wait for it
+                    del pending[future]
+                    counts["timeouts"] += 1
+                    error = TimeoutError(f"No result after {BATCH_TIMEOUT:.0f}s")
+                    metrics.count_error(error, endpoint='/analyze/batch')
+                    yield json.dumps({"index": index, "channel": channel_name, "error": str(error),
+                                      "errorType": type(error).__name__,
+                                      "seconds": round(now - started[index], 3)}) + "\n"
+        yield json.dumps({"summary": {"channels": len(channels), **counts,
+                                      "seconds": round(time.perf_counter() - start, 3)}}) + "\n"
+    finally:
+        # A client that hangs up cancels whatever has not started
+        for future in pending:
+            future.cancel()
+
+@app.route("/analyze/batch", methods=["POST"])
+def analyze_batch():
+    data = request.get_json(silent=True) or {}
+    channels = data.get("channels")
+    if not isinstance(channels, list) or not channels or not all(isinstance(c, str) for c in channels):
+        return jsonify({"error": "channels must be a non-empty list of channel handles"}), 400
+    if len(channels) > BATCH_MAX_CHANNELS:
+        return jsonify({"error": f"At most {BATCH_MAX_CHANNELS} channels per batch, got {len(channels)}"}), 400
+    concurrency = data.get("concurrency", BATCH_CONCURRENCY)
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+        return jsonify({"error": "concurrency must be a positive integer"}), 400
+
+    lines = stream_batch(channels, min(concurrency, BATCH_CONCURRENCY), bool(data.get("refresh")))
+    return Response(lines, mimetype='application/x-ndjson', headers={"X-Accel-Buffering": "no"})
+
+@app.route("/analyze/pool", methods=["GET"])
+def analyze_pool():
+    return jsonify({"driver_path": launcher.driver_path, "engine": ENGINE, "http": extractor.client.stats(), **pool.stats()}), 200
+
+@app.route("/analyze/cache", methods=["GET"])
+def analyze_cache():
+    return jsonify(cache.stats()), 200
+
 if __name__ == "__main__":
     app.run(debug=True, port=5002)
 
@@ -0,0 +1,212 @@
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from procfs import process_memory, process_tree
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def resolve_driver_path(cache_path):
+    """The chromedriver binary, resolved once and remembered on disk.
+
+    ChromeDriverManager checks for (and may download) a matching driver on every install(),
+    which costs a network round trip; later starts reuse the cached path while it still exists.
+    """
+    try:
+        with open(cache_path) as f:
+            path = json.load(f)['path']
+        if os.access(path, os.X_OK):
+            return path
+    except (OSError, ValueError, KeyError):
+        pass
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    path = ChromeDriverManager().install()
+    tmp = cache_path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({"path": path}, f)
+    os.replace(tmp, cache_path)
+    return path
+
+
+def launch_chrome(driver_path):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--log-level=3")
+    options.add_argument("--window-size=1920,1080")
+    options.add_experimental_option("excludeSwitches", ["enable-logging"])
+    return webdriver.Chrome(service=Service(driver_path), options=options)
+
+
+class ChromeLauncher:
+    """Launches headless Chrome, resolving chromedriver on the first launch rather than up front,
+    so a process that never needs a browser never needs Chrome or the network to start"""
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.driver_path = None
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            if self.driver_path is None:
+                self.driver_path = resolve_driver_path(self.cache_path)
+        return launch_chrome(self.driver_path)
+
+
+def driver_rss_kb(driver):
+    """Resident memory of chromedriver and every browser process under it, or None when unknown"""
+    try:
+        pid = driver.service.process.pid
+    except AttributeError:
+        return None
+    sizes = [process_memory(child) for child in process_tree(pid)]
+    return sum(size['rss_kb'] for size in sizes if size)
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+
+
+class BrowserPool:
+    """A fixed number of warm headless browsers that requests check out and give back.
+
+    Browsers are launched ahead of time and health-checked on checkout. One is replaced after
+    `max_uses` analyses, when its process tree passes `max_rss_mb`, when it fails its check or
+    when the request using it fails; replacements launch in the background, off the request path.
+    """
+
+    def __init__(self, launch, size=2, max_uses=50, max_rss_mb=1024, wait_timeout=30.0):
+        self.launch = launch
+        self.size = size
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+        self.wait_timeout = wait_timeout
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.launches = 0
+        self.launch_failures = 0
+        self.recycled = {"uses": 0, "memory": 0, "unhealthy": 0, "failed": 0}
+        self.checkouts = 0
+        self.timeouts = 0
+        self.waits = []
+        self.last_error = None
+        self.started = False
+
+    def start(self):
+        """Launch the browsers on background threads; checkouts wait until one is ready"""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        for _ in range(self.size):
+            self.replace()
+
+    def replace(self):
+        threading.Thread(target=self.add, name='browser-launch', daemon=True).start()
+
+    def add(self):
+        # Keep trying, backing off, so a missing or crashing Chrome never shrinks the pool for good
+        delay = 1.0
+        while True:
+            try:
+                driver = self.launch()
+                break
+            except Exception as e:
+                with self.lock:
+                    self.launch_failures += 1
+                    self.last_error = f"launch failed: {e}"
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+        with self.lock:
+            self.launches += 1
+        self.idle.put(PooledDriver(driver))
+
+    def retire(self, entry, reason):
+        with self.lock:
+            self.recycled[reason] += 1
+        try:
+            entry.driver.quit()
+        except Exception:
+            pass
+        self.replace()
+
+    def healthy(self, entry):
+        try:
+            entry.driver.execute_script('return 1')
+            return True
+        except Exception:
+            return False
+
+    def checkout(self):
+        """A healthy browser, waiting up to `wait_timeout`; give it back with checkin()"""
+        # A pool nobody has started launches its browsers on first use
+        self.start()
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                entry = self.idle.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                with self.lock:
+                    self.timeouts += 1
+                raise PoolTimeout(f"No browser free after {self.wait_timeout:.0f}s "
+                                  f"({self.size} in the pool, {self.idle.qsize()} idle)")
+            if self.healthy(entry):
+                break
+            self.retire(entry, "unhealthy")
+        with self.lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.waits.append(time.perf_counter() - start)
+            del self.waits[:-1024]
+        return entry
+
+    def checkin(self, entry, failed=False):
+        entry.uses += 1
+        with self.lock:
+            self.in_use -= 1
+        if failed:
+            self.retire(entry, "failed")
+        elif self.max_uses and entry.uses >= self.max_uses:
+            self.retire(entry, "uses")
+        elif self.max_rss_mb and (driver_rss_kb(entry.driver) or 0) > self.max_rss_mb * 1024:
+            self.retire(entry, "memory")
+        else:
+            self.idle.put(entry)
+
+    def stats(self):
+        with self.lock:
+            waits = np.array(self.waits) * 1000
+            p50, p99 = np.percentile(waits, [50, 99]) if len(waits) else (None, None)
+            return {
+                "size": self.size,
+                "started": self.started,
+                "idle": self.idle.qsize(),
+                "in_use": self.in_use,
+                "launching": (self.size if self.started else 0) - self.idle.qsize() - self.in_use,
+                "launches": self.launches,
+                "launch_failures": self.launch_failures,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_p50_ms": p50,
+                "wait_p99_ms": p99,
+                "max_uses": self.max_uses,
+                "max_rss_mb": self.max_rss_mb,
+                "recycled": dict(self.recycled),
+                "last_error": self.last_error,
+            }
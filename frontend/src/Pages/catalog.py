@@ -0,0 +1,261 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from compiled_model import load_compiled
+from earnings_regions import DEFAULT_MAX_BYTES, build_regions
+from range_index import RangeIndex
+from similar_index import LazyIndex
+
+
+def convert_views_to_number(view_str):
+    if isinstance(view_str, str):
+        view_str = view_str.strip()
+        try:
+            if view_str[-1] == 'B':
+                return float(view_str[:-1]) * 1e9
+            elif view_str[-1] == 'M':
+                return float(view_str[:-1]) * 1e6
+            elif view_str[-1] == 'K':
+                return float(view_str[:-1]) * 1e3
+            else:
+                return float(view_str.replace(',', ''))
+        except Exception:
+            return np.nan
+    else:
+        return view_str
+
+
+# Model inputs, in the order the earnings model was trained on
+FEATURES = [
+    'subscribers', 'video_views', 'video_views_for_the_last_30_days',
+    'country', 'product_category', 'brand_budget_usd', 'min_views_required'
+]
+
+VIEW_MULTIPLIERS = {'K': 1e3, 'M': 1e6, 'B': 1e9}
+
+NO_MATCH_MESSAGE = "No creators found for this country and product category"
+FILTERED_OUT_MESSAGE = "No creators in this country and product category match the filters"
+
+
+def parse_views(series):
+    """Vectorized convert_views_to_number: returns the parsed column and how many values were malformed"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float), 0
+    # View counts repeat heavily ("1.2M"), so parse each distinct value once and broadcast by code
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Series(uniques, dtype=object)
+    # Plain numbers (and numbers mixed into an object column) parse in C; only the rest needs string work
+    parsed = pd.to_numeric(uniques, errors='coerce')
+    rest = parsed.isna()
+    if rest.any():
+        text = uniques[rest].str.strip()
+        multiplier = text.str[-1].map(VIEW_MULTIPLIERS)
+        has_suffix = multiplier.notna()
+        # Suffixed values are parsed as-is ("1,2K" stays malformed); plain ones may use thousands separators
+        number = text.str[:-1].where(has_suffix, text.str.replace(',', '', regex=False))
+        parsed[rest] = pd.to_numeric(number, errors='coerce') * multiplier.where(has_suffix, 1.0)
+    bad = parsed.isna().to_numpy()
+    # Missing values get code -1 and map to the trailing NaN slot
+    values = np.append(parsed.to_numpy(dtype=float), np.nan)
+    malformed = int(np.bincount(codes[codes >= 0], minlength=len(bad))[bad].sum())
+    return pd.Series(values[codes], index=series.index, name=series.name), malformed
+
+
+def build_partition_index(df):
+    # Case-fold the filter keys once so a request only touches its own (country, channel_type) block
+    keys = [df['country'].str.lower(), df['channel_type'].str.lower()]
+    return {key: block for key, block in df.groupby(keys, sort=False)}
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def version_id(signature):
+    return hashlib.sha1(repr(signature).encode()).hexdigest()[:12]
+
+
+class Catalog:
+    """One immutable version of the creator dataset and the model trained for it"""
+
+    def __init__(self, data, model, version, malformed=None, regions_max_bytes=DEFAULT_MAX_BYTES):
+        self.data = data
+        self.rows = len(data)
+        self.model = model
+        self.version = version
+        self.malformed = malformed or {}
+        self.partitions = build_partition_index(data)
+        self.regions = build_regions(model, self.partitions, FEATURES, regions_max_bytes)
+        self.ranges = RangeIndex(self.partitions)
+        self.similar = LazyIndex(data)
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+        # Versions derived from this one by the delta log share its base and add to `changed`
+        self.base_version = version
+        self.changed = frozenset()
+        self.delta_offset = 0
+
+
+def read_dataset(data_path):
+    """Read the CSV and parse derived columns; returns the frame and malformed value counts per column"""
+    data = pd.read_csv(data_path)
+    data['video_views'], malformed = parse_views(data['video_views'])
+    if malformed:
+        print(f"{data_path}: {malformed} malformed video_views values loaded as NaN")
+    return data, {'video_views': malformed}
+
+
+def load_model(model_path):
+    # A .npz written by `python compiled_model.py export` is served without loading sklearn
+    if model_path.endswith('.npz'):
+        return load_compiled(model_path)
+    return joblib.load(model_path)
+
+
+def load_catalog(data_path, model_path, version, shard=None, regions_max_bytes=DEFAULT_MAX_BYTES):
+    data, malformed = read_dataset(data_path)
+    if shard is not None:
+        data = shard.select(data)
+    return Catalog(data, load_model(model_path), version, malformed, regions_max_bytes)
+
+
+class CatalogReloader:
+    """Polls the files a Catalog is built from and swaps in a fresh one when they change.
+
+    `load` is called with the new version id and returns a Catalog. Requests read `current`
+    once and keep using that Catalog, so in-flight work finishes on the version it started
+    with while the next one is prepared off the request path.
+    """
+
+    def __init__(self, load, paths, interval=5.0):
+        self.load = load
+        self.paths = list(paths)
+        self.interval = interval
+        self.signature = self.read_signature()
+        self.current = load(version_id(self.signature))
+        self.pending = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+        self.thread = None
+        self.listeners = []
+
+    def subscribe(self, listener):
+        """Call `listener(catalog)` after each successful reload, on the thread that reloaded"""
+        self.listeners.append(listener)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='catalog-reloader', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.poll()
+
+    def poll(self, force=False):
+        try:
+            signature = self.read_signature()
+        except OSError as e:
+            self.last_error = str(e)
+            return False
+        if signature == self.signature and not force:
+            self.pending = None
+            return False
+        # Wait for the files to stop changing before loading, so a half-written copy is never picked up
+        if signature != self.pending and not force:
+            self.pending = signature
+            return False
+        return self.reload()
+
+    def read_signature(self):
+        return tuple(file_signature(path) for path in self.paths)
+
+    def reload(self):
+        with self.lock:
+            try:
+                signature = self.read_signature()
+                catalog = self.load(version_id(signature))
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                return False
+            self.current, self.signature = catalog, signature
+            self.pending = None
+            self.reloads += 1
+            self.last_error = None
+        for listener in self.listeners:
+            listener(catalog)
+        return True
+
+    def update(self, change):
+        """Swap in `change(current)` without reloading; listeners are called only when the version moves"""
+        with self.lock:
+            previous = self.current
+            catalog = self.current = change(previous)
+        if catalog.version == previous.version:
+            return False
+        for listener in self.listeners:
+            listener(catalog)
+        return True
+
+    def status(self):
+        return {
+            "version": self.current.version,
+            "loaded_at": self.current.loaded_at,
+            "rows": self.current.rows,
+            "malformed": self.current.malformed,
+            "precomputed_regions": self.current.regions.stats() if self.current.regions else None,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+def benchmark_views(data_path, rows, repeat=3):
+    """Time the row-wise and vectorized view parsers on the CSV's view column tiled to `rows` values"""
+    views = pd.read_csv(data_path, usecols=['video_views'])['video_views']
+    views = pd.Series(np.resize(views.to_numpy(dtype=object), rows), dtype=views.dtype)
+
+    def best(fn):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings), result
+
+    apply_s, expected = best(lambda: views.apply(convert_views_to_number))
+    vector_s, (parsed, malformed) = best(lambda: parse_views(views))
+    return {
+        "rows": rows,
+        "apply_ms": apply_s * 1000,
+        "vectorized_ms": vector_s * 1000,
+        "speedup": apply_s / vector_s if vector_s else None,
+        "identical": bool(np.array_equal(expected.to_numpy(dtype=float), parsed.to_numpy(), equal_nan=True)),
+        "malformed": malformed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dataset ingest')
+    parser.add_argument('--data', default='final.csv')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps([benchmark_views(args.data, rows, args.repeat) for rows in args.rows], indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run one computation per key at a time; concurrent callers with the same key share its result"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def run(self, key, compute):
+        """Returns (result, shared): shared is True when another request computed it"""
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            # Later requests start a fresh flight; they should hit the response cache instead
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def stats(self):
+        with self.lock:
+            return {"leaders": self.leaders, "coalesced": self.followers, "in_flight": len(self.flights)}
+
+
+class MicroBatcher:
+    """Gather concurrent model.predict calls for up to `window` seconds into one call.
+
+    The first request to arrive leads the batch: it waits out the window (or until `max_batch`
+    requests have joined), predicts on the concatenated frames and hands each request its slice.
+    Requests only join a batch for the same model, so a reload never mixes catalog versions.
+    """
+
+    def __init__(self, window, max_batch=64):
+        self.window = window
+        self.max_batch = max_batch
+        self.condition = threading.Condition()
+        self.open = {}
+        self.batches = 0
+        self.requests = 0
+        self.largest = 0
+
+    def predict(self, model, frame):
+        flight = Flight()
+        with self.condition:
+            batch = self.open.get(id(model))
+            leader = batch is None
+            if leader:
+                batch = self.open[id(model)] = (model, [])
+            batch[1].append((frame, flight))
+            if len(batch[1]) >= self.max_batch:
+                self.condition.notify_all()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        deadline = time.monotonic() + self.window
+        with self.condition:
+            while len(batch[1]) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            del self.open[id(model)]
+            jobs = batch[1]
+            self.batches += 1
+            self.requests += len(jobs)
+            self.largest = max(self.largest, len(jobs))
+        try:
+            predictions = np.asarray(model.predict(pd.concat([frame for frame, _ in jobs])))
+        except Exception as e:
+            for _, job in jobs:
+                job.error = e
+                job.done.set()
+            raise
+        offsets = np.cumsum([0] + [len(frame) for frame, _ in jobs])
+        for (_, job), start, stop in zip(jobs, offsets[:-1], offsets[1:]):
+            job.result = predictions[start:stop]
+            job.done.set()
+        return flight.result
+
+    def stats(self):
+        with self.condition:
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch": self.requests / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest,
+            }
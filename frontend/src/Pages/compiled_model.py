@@ -0,0 +1,264 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+# Column kinds of the matrix the tree was trained on
+NUMERIC, ONEHOT, ORDINAL = 0, 1, 2
+TREE_LEAF = -1
+
+
+class CompiledTree:
+    """Pure-NumPy batch evaluator for an exported decision tree and its column encoding.
+
+    `predict` takes the same DataFrame the original model did and returns identical
+    predictions, without importing sklearn.
+    """
+
+    def __init__(self, arrays, spec):
+        self.children_left = arrays['children_left']
+        self.children_right = arrays['children_right']
+        self.node_column = arrays['node_column']
+        self.threshold = arrays['threshold']
+        self.missing_go_to_left = arrays['missing_go_to_left']
+        self.value = arrays['value']
+        self.max_depth = int(spec['max_depth'])
+        self.inputs = spec['inputs']
+        self.columns = spec['columns']
+        # Category -> code tables for the encoded inputs
+        self.lookups = spec['categories']
+        self.missing_codes = spec['missing_codes']
+        # Group the matrix columns by the input they read, so each input is pulled from the frame once
+        self.numeric, self.onehot, self.ordinal = {}, {}, []
+        for j, column in enumerate(self.columns):
+            if column['kind'] == NUMERIC:
+                self.numeric.setdefault(column['input'], []).append(j)
+            elif column['kind'] == ONEHOT:
+                self.onehot.setdefault(column['input'], []).append((j, column['code']))
+            else:
+                self.ordinal.append((j, column))
+
+    def encode(self, values, name):
+        # -1 marks a category the encoder never saw, -2 a missing value
+        lookup = self.lookups[name]
+        return np.fromiter(
+            (lookup.get(v, -1) if isinstance(v, str) else -2 for v in values),
+            dtype=np.int64, count=len(values),
+        )
+
+    def features(self, frame):
+        X = np.empty((len(frame), len(self.columns)), dtype=np.float32)
+        for name, js in self.numeric.items():
+            # The tree compares float32 features against float64 thresholds, as sklearn does
+            X[:, js] = frame[name].to_numpy(dtype=np.float64)[:, None]
+        codes = {}
+        for name in list(self.onehot) + [column['input'] for _, column in self.ordinal]:
+            if name not in codes:
+                codes[name] = self.encode(frame[name].to_numpy(dtype=object), name)
+        for name, targets in self.onehot.items():
+            code = codes[name]
+            # A one-hot encoder that saw missing values during fit gives them their own column
+            if name in self.missing_codes:
+                code = np.where(code == -2, self.missing_codes[name], code)
+            js, categories = zip(*targets)
+            X[:, list(js)] = code[:, None] == np.array(categories)
+        for j, column in self.ordinal:
+            code = codes[column['input']]
+            X[:, j] = np.where(code == -1, column['unknown_value'], code)
+            X[code == -2, j] = column['missing_value']
+        return X
+
+    def apply(self, X):
+        rows = np.arange(len(X))
+        node = np.zeros(len(X), dtype=np.intp)
+        for _ in range(self.max_depth):
+            left = self.children_left[node]
+            internal = left != TREE_LEAF
+            if not internal.any():
+                break
+            x = X[rows, self.node_column[node]]
+            go_left = np.where(np.isnan(x), self.missing_go_to_left[node], x <= self.threshold[node])
+            node = np.where(internal, np.where(go_left, left, self.children_right[node]), node)
+        return node
+
+    def predict(self, frame):
+        return self.value[self.apply(self.features(frame))]
+
+
+def encoder_columns(encoder, name, feature_index):
+    """Describe the output columns an encoder produces for one input column"""
+    kind = type(encoder).__name__
+    categories = list(encoder.categories_[feature_index])
+    if getattr(encoder, 'infrequent_categories_', None) is not None and any(
+            c is not None for c in encoder.infrequent_categories_):
+        raise ValueError(f"{kind} with infrequent categories is not supported")
+    known = [c for c in categories if isinstance(c, str)]
+    has_missing = len(known) != len(categories)
+    if len(known) + has_missing != len(categories):
+        raise ValueError(f"{kind} on {name!r} has non-string categories")
+    # Missing values take the code of the NaN category when the encoder learned one
+    missing_code = categories.index(next(c for c in categories if not isinstance(c, str))) if has_missing else None
+    positions = {c: categories.index(c) for c in known}
+
+    if kind == 'OneHotEncoder':
+        drop = getattr(encoder, 'drop_idx_', None)
+        dropped = drop[feature_index] if drop is not None else None
+        columns = [
+            {"kind": ONEHOT, "input": name, "code": code}
+            for code in range(len(categories)) if code != dropped
+        ]
+        if encoder.handle_unknown not in ('ignore', 'error', 'infrequent_if_exist'):
+            raise ValueError(f"OneHotEncoder handle_unknown={encoder.handle_unknown!r} is not supported")
+    elif kind == 'OrdinalEncoder':
+        unknown = encoder.unknown_value if encoder.handle_unknown == 'use_encoded_value' else np.nan
+        missing = getattr(encoder, 'encoded_missing_value', np.nan)
+        columns = [{
+            "kind": ORDINAL, "input": name,
+            "unknown_value": float(unknown), "missing_value": float(missing),
+        }]
+    else:
+        raise ValueError(f"Unsupported encoder {kind}")
+    return columns, positions, missing_code
+
+
+def is_passthrough(transformer):
+    if isinstance(transformer, str):
+        return transformer == 'passthrough'
+    # Recent sklearn wraps a passthrough remainder in an identity FunctionTransformer
+    return type(transformer).__name__ == 'FunctionTransformer' and transformer.func is None
+
+
+def export_model(model):
+    """Flatten a DecisionTreeRegressor, optionally behind a ColumnTransformer in a Pipeline, into arrays"""
+    steps = model.steps if hasattr(model, 'steps') else [('model', model)]
+    tree_model = steps[-1][1]
+    if type(tree_model).__name__ != 'DecisionTreeRegressor' or tree_model.n_outputs_ != 1:
+        raise ValueError(f"Only single-output DecisionTreeRegressor models can be compiled, got {type(tree_model).__name__}")
+    preprocessing = [step for _, step in steps[:-1] if step not in (None, 'passthrough')]
+    if len(preprocessing) > 1:
+        raise ValueError("At most one preprocessing step is supported")
+
+    inputs = [str(name) for name in getattr(model, 'feature_names_in_', [])]
+    columns, categories, missing_codes = [], {}, {}
+    if preprocessing:
+        transformer = preprocessing[0]
+        if type(transformer).__name__ != 'ColumnTransformer':
+            raise ValueError(f"Unsupported preprocessing step {type(transformer).__name__}")
+        for _, step, selected in transformer.transformers_:
+            if isinstance(selected, slice) or np.asarray(selected).dtype == bool:
+                raise ValueError("Column selections must be names or indices")
+            names = [inputs[c] if isinstance(c, (int, np.integer)) else str(c) for c in np.atleast_1d(selected)]
+            if step == 'drop' or not names:
+                continue
+            if is_passthrough(step):
+                columns.extend({"kind": NUMERIC, "input": name} for name in names)
+                continue
+            for i, name in enumerate(names):
+                out, positions, missing_code = encoder_columns(step, name, i)
+                columns.extend(out)
+                categories[name] = positions
+                if missing_code is not None and out[0]['kind'] == ONEHOT:
+                    missing_codes[name] = missing_code
+    else:
+        if not inputs:
+            raise ValueError("A bare tree must have been fitted on a DataFrame so its columns are known")
+        columns = [{"kind": NUMERIC, "input": name} for name in inputs]
+
+    if len(columns) != tree_model.n_features_in_:
+        raise ValueError(f"Encoded width {len(columns)} does not match the tree's {tree_model.n_features_in_} features")
+
+    tree = tree_model.tree_
+    # Keep only the columns some split reads, and point each node at its compact column
+    used = sorted(set(int(f) for f in tree.feature if f >= 0))
+    compact = {f: j for j, f in enumerate(used)}
+    node_column = np.array([compact.get(int(f), 0) for f in tree.feature], dtype=np.intp)
+    missing_left = getattr(tree, 'missing_go_to_left', None)
+    arrays = {
+        "children_left": tree.children_left.astype(np.intp),
+        "children_right": tree.children_right.astype(np.intp),
+        "node_column": node_column,
+        "threshold": tree.threshold.astype(np.float64),
+        "missing_go_to_left": (np.zeros(tree.node_count, dtype=bool) if missing_left is None
+                               else np.asarray(missing_left, dtype=bool)),
+        "value": tree.value[:, 0, 0].astype(np.float64),
+    }
+    spec = {
+        "max_depth": int(tree.max_depth),
+        "inputs": inputs,
+        "columns": [columns[f] for f in used],
+        "categories": categories,
+        "missing_codes": missing_codes,
+    }
+    return arrays, spec
+
+
+def save_compiled(path, arrays, spec):
+    np.savez(path, spec=np.array(json.dumps(spec)), **arrays)
+
+
+def load_compiled(path):
+    with np.load(path, allow_pickle=False) as bundle:
+        arrays = {name: bundle[name] for name in bundle.files if name != 'spec'}
+        spec = json.loads(str(bundle['spec']))
+    return CompiledTree(arrays, spec)
+
+
+def compile_model(model, sample):
+    """Export `model` and check the compiled evaluator reproduces its predictions on `sample` exactly"""
+    arrays, spec = export_model(model)
+    compiled = CompiledTree(arrays, spec)
+    if not np.array_equal(compiled.predict(sample), np.asarray(model.predict(sample), dtype=np.float64)):
+        raise ValueError("Compiled predictions differ from the original model")
+    return compiled, arrays, spec
+
+
+def sample_frame(data_path, features):
+    # final.csv carries the brief columns the model was trained with, so its rows are a realistic sample
+    from catalog import read_dataset
+    data, _ = read_dataset(data_path)
+    return data[features]
+
+
+def benchmark(model, compiled, sample, sizes=(5, 50, 300), repeat=200):
+    results = []
+    for size in sizes:
+        batch = sample.sample(n=size, replace=size > len(sample), random_state=size)
+        timings = {}
+        for label, predictor in (("sklearn", model), ("compiled", compiled)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                predictor.predict(batch)
+            timings[label] = (time.perf_counter() - start) / repeat * 1e6
+        results.append({
+            "rows": size,
+            "sklearn_us": timings["sklearn"],
+            "compiled_us": timings["compiled"],
+            "speedup": timings["sklearn"] / timings["compiled"],
+        })
+    return results
+
+
+def main():
+    import joblib
+    from catalog import FEATURES
+
+    parser = argparse.ArgumentParser(description='Compile the recommendation model into NumPy arrays')
+    parser.add_argument('command', choices=['export', 'bench'])
+    parser.add_argument('--data', default='final.csv')
+    parser.add_argument('--model', default='creator_recommendation_model.joblib')
+    parser.add_argument('--out', default='creator_recommendation_model.npz')
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    sample = sample_frame(args.data, FEATURES)
+    compiled, arrays, spec = compile_model(model, sample)
+    if args.command == 'export':
+        save_compiled(args.out, arrays, spec)
+        print(f"Wrote {len(arrays['value'])} nodes over {len(spec['columns'])} columns to {args.out}")
+    else:
+        print(json.dumps(benchmark(model, compiled, sample), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+import argparse
+import copy
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from catalog import load_catalog, parse_views
+from similar_index import ExcludingIndex
+from snapshot import read_manifest, write_snapshot
+
+OPS = ('upsert', 'delete')
+
+
+def append_entries(log_path, entries):
+    """Append updates to the log, one JSON object per line, synced before returning.
+
+    An entry names a creator by `youtuber` and carries the columns to set, e.g.
+    {"youtuber": "MrBeast", "video_views_for_the_last_30_days": 2.1e9}; a creator not in the
+    catalog yet is added. {"op": "delete", "youtuber": ...} removes one.
+    """
+    with open(log_path, 'a') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_entries(log_path, offset):
+    """Lines after byte `offset`, and the offset just past the last complete one.
+
+    A line still being written has no newline yet and is left for the next read.
+    """
+    try:
+        with open(log_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < offset:
+                raise ValueError(f"{log_path} is shorter than the {offset} bytes already applied; "
+                                 "the log may only be appended to")
+            f.seek(offset)
+            chunk = f.read()
+    except FileNotFoundError:
+        return [], offset
+    end = chunk.rfind(b'\n') + 1
+    return [line for line in chunk[:end].splitlines() if line.strip()], offset + end
+
+
+def creator_name(name):
+    # Same matching as the similar-creators lookup
+    return str(name).strip().lower()
+
+
+def row_key(row):
+    # Same partition as build_partition_index; creators missing either key are in none
+    country, channel_type = row.get('country'), row.get('channel_type')
+    if isinstance(country, str) and isinstance(channel_type, str):
+        return country.lower(), channel_type.lower()
+    return None
+
+
+class DeltaState:
+    """What the log has changed since a base catalog: the current row of every creator it touched"""
+
+    def __init__(self, base):
+        self.data = base.data
+        self.rows_by_name = base.similar.rows_by_name
+        self.names = {}
+        self.rows = {}
+        self.deleted = set()
+        self.next_label = int(base.data.index.max()) + 1 if len(base.data) else 0
+        self.numeric = {name for name in base.data.columns if pd.api.types.is_numeric_dtype(base.data[name])}
+        self.integer = {name for name in self.numeric if pd.api.types.is_integer_dtype(base.data[name])}
+        self.applied = 0
+        self.rejected = 0
+        self.last_rejected = None
+
+    def copy(self):
+        state = copy.copy(self)
+        state.names = dict(self.names)
+        state.rows = dict(self.rows)
+        state.deleted = set(self.deleted)
+        return state
+
+    def label(self, name):
+        if name in self.names:
+            return self.names[name]
+        position = self.rows_by_name.get(name)
+        return None if position is None else self.data.index[position]
+
+    def row(self, label):
+        if label in self.rows:
+            return dict(self.rows[label])
+        return self.data.loc[label].to_dict()
+
+    def parse(self, line):
+        """(op, creator name, column values) of one log line; ValueError when it cannot be applied"""
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            raise ValueError("not valid JSON")
+        if not isinstance(entry, dict):
+            raise ValueError("not a JSON object")
+        op = entry.pop('op', 'upsert')
+        if op not in OPS:
+            raise ValueError(f"unknown op {op!r}")
+        name = entry.get('youtuber')
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError("no youtuber")
+        unknown = sorted(set(entry) - set(self.data.columns))
+        if unknown:
+            raise ValueError(f"unknown columns {unknown}")
+        fields = {}
+        for column, value in entry.items():
+            if isinstance(value, (dict, list)):
+                raise ValueError(f"{column} is not a single value")
+            if column == 'video_views':
+                # Scraped view counts may come as "1.2M", like the CSV
+                value = parse_views(pd.Series([value], dtype=object))[0].iloc[0]
+            elif column in self.numeric:
+                value = np.nan if value is None else float(value)
+                if column in self.integer and value.is_integer():
+                    value = int(value)
+            elif value is not None:
+                value = str(value)
+            fields[column] = np.nan if value is None else value
+        return op, creator_name(name), fields
+
+
+def apply_entries(catalog, lines, offset):
+    """A new catalog version with the log lines applied, rebuilding only the partitions they touch.
+
+    The catalog passed in is left as it is, for requests still using it. Lines that cannot be
+    applied are counted and skipped, since an append-only log cannot be corrected in place.
+    `data` and the similar-creators index stay those of the base until the next compaction or
+    reload; creators deleted or changed since are left out of similar-creators lookups.
+    """
+    if catalog.data is None:
+        raise ValueError("The partitioned catalog does not take delta updates")
+    state = catalog.deltas.copy() if getattr(catalog, 'deltas', None) else DeltaState(catalog)
+    # Partition each touched creator was in before this batch
+    touched = {}
+    rows = catalog.rows
+    for line in lines:
+        try:
+            op, name, fields = state.parse(line)
+        except ValueError as e:
+            state.rejected += 1
+            state.last_rejected = f"{e}: {line[:200].decode(errors='replace')}"
+            continue
+        state.applied += 1
+        label = state.label(name)
+        if label is not None and label not in touched:
+            touched[label] = row_key(state.row(label))
+        if op == 'delete':
+            if label is not None:
+                state.rows.pop(label, None)
+                state.deleted.add(label)
+                state.names[name] = None
+                rows -= 1
+            continue
+        if label is None:
+            label = state.next_label
+            state.next_label += 1
+            state.names[name] = label
+            touched[label] = None
+            row = {column: np.nan for column in state.data.columns}
+            rows += 1
+        else:
+            row = state.row(label)
+        row.update(fields)
+        state.rows[label] = row
+
+    derived = copy.copy(catalog)
+    derived.deltas = state
+    derived.delta_offset = offset
+    if not touched:
+        return derived
+
+    affected = {key for key in touched.values() if key is not None}
+    affected |= {row_key(state.rows[label]) for label in touched if label in state.rows} - {None}
+    derived.partitions = dict(catalog.partitions)
+    derived.ranges = copy.copy(catalog.ranges)
+    derived.ranges.partitions = dict(catalog.ranges.partitions)
+    labels = list(touched)
+    for key in affected:
+        frames = []
+        block = catalog.partitions.get(key)
+        if block is not None:
+            frames.append(block[~block.index.isin(labels)])
+        moved_in = {label: state.rows[label] for label in labels if label in state.rows and row_key(state.rows[label]) == key}
+        if moved_in:
+            frames.append(pd.DataFrame.from_dict(moved_in, orient='index', columns=state.data.columns))
+        # Labels grow in catalog order and new creators go last, as if appended to the CSV
+        block = pd.concat(frames).sort_index() if len(frames) > 1 else frames[0] if frames else None
+        if block is None or not len(block):
+            derived.partitions.pop(key, None)
+            derived.ranges.partitions.pop(key, None)
+            continue
+        derived.partitions[key] = block
+        derived.ranges.partitions[key] = derived.ranges.build(block)
+    if catalog.regions is not None:
+        # Regions of the changed partitions are rebuilt from their new blocks when next used
+        derived.regions = copy.copy(catalog.regions)
+        derived.regions.partitions = catalog.regions.partitions.derive(derived.partitions, affected)
+    base_similar = getattr(catalog.similar, 'index', catalog.similar)
+    positions = catalog.data.index.get_indexer(list(state.deleted | set(state.rows)))
+    derived.similar = ExcludingIndex(base_similar, positions[positions >= 0])
+    derived.rows = rows
+    derived.version = f"{catalog.base_version}+{offset}"
+    derived.changed = catalog.changed | affected
+    derived.loaded_at = datetime.now().isoformat(timespec='seconds')
+    return derived
+
+
+def compacted_data(catalog):
+    """The base data with every logged change folded in, in the order an incremental apply keeps"""
+    data = catalog.data
+    state = getattr(catalog, 'deltas', None)
+    if state is None:
+        return data
+    replaced = data.index.isin(list(state.deleted | set(state.rows)))
+    frames = [data[~replaced]]
+    if state.rows:
+        frames.append(pd.DataFrame.from_dict(state.rows, orient='index', columns=data.columns))
+    return pd.concat(frames).sort_index().reset_index(drop=True)
+
+
+class DeltaTailer:
+    """Tails the delta log and applies new lines to the reloader's current catalog in place of a reload.
+
+    The offset applied so far travels with each catalog, so a reload (including one of the
+    snapshot a compaction wrote) replays the log from wherever its base left off. With a snapshot
+    directory, compaction periodically folds the applied changes into a new snapshot build whose
+    manifest records the offset; without one the whole log is replayed over each fresh load.
+    """
+
+    def __init__(self, reloader, log_path, interval=1.0, snapshot_dir=None, compact_interval=300.0):
+        self.reloader = reloader
+        self.log_path = log_path
+        self.interval = interval
+        self.snapshot_dir = snapshot_dir
+        self.compact_interval = compact_interval if snapshot_dir else 0
+        self.next_compaction = time.monotonic() + self.compact_interval
+        self.compacting = True
+        self.lock = threading.Lock()
+        self.updates = 0
+        self.last_apply_ms = None
+        self.compactions = 0
+        self.last_compaction_at = None
+        self.last_compaction_seconds = None
+        self.last_error = None
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='delta-log', daemon=True)
+            self.thread.start()
+
+    def after_fork(self):
+        """Tail from a forked worker; compaction stays with the master"""
+        self.lock = threading.Lock()
+        self.compacting = False
+        self.thread = None
+        self.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.poll()
+            self.maybe_compact()
+
+    def poll(self):
+        """Apply whatever was appended since the current catalog's offset; True if the version changed"""
+        start = time.perf_counter()
+
+        def change(catalog):
+            lines, offset = read_entries(self.log_path, catalog.delta_offset)
+            if offset == catalog.delta_offset:
+                return catalog
+            return apply_entries(catalog, lines, offset)
+
+        with self.lock:
+            try:
+                updated = self.reloader.update(change)
+            except Exception as e:
+                self.last_error = str(e)
+                return False
+            if updated:
+                self.updates += 1
+                self.last_apply_ms = (time.perf_counter() - start) * 1000
+            self.last_error = None
+            return updated
+
+    def maybe_compact(self):
+        if self.compacting and self.compact_interval and time.monotonic() >= self.next_compaction:
+            self.next_compaction = time.monotonic() + self.compact_interval
+            return self.compact()
+        return False
+
+    def compact(self):
+        """Write the current catalog as a new snapshot build; the reloader picks it up like any other"""
+        catalog = self.reloader.current
+        state = getattr(catalog, 'deltas', None)
+        if self.snapshot_dir is None or state is None or not state.applied:
+            return False
+        start = time.perf_counter()
+        try:
+            manifest = read_manifest(self.snapshot_dir)
+            model = joblib.load(os.path.join(self.snapshot_dir, manifest['model']), mmap_mode='r')
+            write_snapshot(compacted_data(catalog), catalog.malformed, model, self.snapshot_dir, catalog.delta_offset)
+        except Exception as e:
+            self.last_error = f"compaction failed: {e}"
+            return False
+        self.compactions += 1
+        self.last_compaction_at = datetime.now().isoformat(timespec='seconds')
+        self.last_compaction_seconds = time.perf_counter() - start
+        return True
+
+    def stats(self):
+        catalog = self.reloader.current
+        state = getattr(catalog, 'deltas', None)
+        try:
+            log_bytes = os.path.getsize(self.log_path)
+        except OSError:
+            log_bytes = None
+        return {
+            "log": self.log_path,
+            "log_bytes": log_bytes,
+            "applied_offset": catalog.delta_offset,
+            "version": catalog.version,
+            "base_version": catalog.base_version,
+            "entries_since_base": state.applied if state else 0,
+            "creators_changed_since_base": len(state.rows) + len(state.deleted) if state else 0,
+            "partitions_changed_since_base": len(catalog.changed),
+            "rejected": state.rejected if state else 0,
+            "last_rejected": state.last_rejected if state else None,
+            "updates": self.updates,
+            "last_apply_ms": self.last_apply_ms,
+            "compaction_interval": self.compact_interval or None,
+            "compactions": self.compactions,
+            "last_compaction_at": self.last_compaction_at,
+            "last_compaction_seconds": self.last_compaction_seconds,
+            "last_error": self.last_error,
+        }
+
+
+def benchmark(data_path, model_path, batches=(1, 10, 100, 1000), seed=0):
+    """Time applying batches of random view refreshes against rebuilding the whole catalog"""
+    catalog = load_catalog(data_path, model_path, 'bench')
+    rng = np.random.default_rng(seed)
+    names = catalog.data['youtuber'].dropna().astype(str).to_numpy()
+    start = time.perf_counter()
+    load_catalog(data_path, model_path, 'bench')
+    results = {"rows": catalog.rows, "full_reload_ms": (time.perf_counter() - start) * 1000, "batches": []}
+    for size in batches:
+        lines = [json.dumps({"youtuber": str(name), "video_views_for_the_last_30_days": float(views)}).encode()
+                 for name, views in zip(rng.choice(names, size), rng.lognormal(15, 2, size))]
+        start = time.perf_counter()
+        derived = apply_entries(catalog, lines, size)
+        results["batches"].append({"entries": size, "apply_ms": (time.perf_counter() - start) * 1000,
+                                   "partitions_rebuilt": len(derived.changed)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Append to or benchmark the catalog delta log')
+    parser.add_argument('command', choices=['append', 'bench'])
+    parser.add_argument('--log', default='final.deltas.jsonl')
+    parser.add_argument('--data', default='final.csv')
+    parser.add_argument('--model', default='creator_recommendation_model.joblib')
+    parser.add_argument('--batches', type=int, nargs='+', default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    if args.command == 'append':
+        # JSON objects on stdin, one per line, e.g. from the scraper
+        entries = [json.loads(line) for line in sys.stdin if line.strip()]
+        append_entries(args.log, entries)
+        print(f"Appended {len(entries)} entries to {args.log}")
+    else:
+        print(json.dumps(benchmark(args.data, args.model, args.batches), indent=2))
+
+
+if __name__ == '__main__':
+    main()
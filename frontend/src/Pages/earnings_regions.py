@@ -0,0 +1,239 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from functools import partial
+
+import numpy as np
+
+from coalesce import SingleFlight
+from compiled_model import NUMERIC, TREE_LEAF, CompiledTree, export_model
+
+# The only model inputs that come from the request rather than the creator's row
+VARYING = ('brand_budget_usd', 'min_views_required')
+# Bytes of region tables kept per catalog; least recently used partitions are rebuilt when needed again
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def regions_nbytes(regions):
+    return sum(value.nbytes for value in regions.values() if isinstance(value, np.ndarray))
+
+
+class RegionCache(Mapping):
+    """Each partition's regions, built from its block on first use and kept within `max_bytes`.
+
+    Building every partition up front costs seconds and several times the frame's memory on
+    large catalogs, most of it for partitions no request asks about. A build runs outside the
+    lock, and concurrent requests for one partition share it.
+    """
+
+    def __init__(self, build, blocks, max_bytes=DEFAULT_MAX_BYTES):
+        self.build = build
+        self.blocks = blocks
+        self.max_bytes = max_bytes
+        self.resident = OrderedDict()
+        self.resident_bytes = 0
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.hits = 0
+        self.builds = 0
+        self.evictions = 0
+
+    def derive(self, blocks, changed):
+        """A cache over new blocks that keeps what was built for partitions not in `changed`"""
+        derived = RegionCache(self.build, blocks, self.max_bytes)
+        with self.lock:
+            for key, regions in self.resident.items():
+                if key not in changed:
+                    derived.resident[key] = regions
+                    derived.resident_bytes += regions_nbytes(regions)
+        return derived
+
+    def after_fork(self):
+        # A build the parent's leaderboards thread had in flight never finishes here, and its
+        # lock may have been held at the fork; the next request for that partition builds it again
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+
+    def resident_entry(self, key):
+        with self.lock:
+            regions = self.resident.get(key)
+            if regions is not None:
+                self.resident.move_to_end(key)
+                self.hits += 1
+            return regions
+
+    def __getitem__(self, key):
+        regions = self.resident_entry(key)
+        if regions is not None:
+            return regions
+        if key not in self.blocks:
+            raise KeyError(key)
+        regions, _ = self.flights.run(key, partial(self.build_cold, key))
+        return regions
+
+    def build_cold(self, key):
+        regions = self.resident_entry(key)
+        if regions is not None:
+            return regions
+        regions = self.build(self.blocks[key])
+        with self.lock:
+            self.resident[key] = regions
+            self.resident_bytes += regions_nbytes(regions)
+            self.builds += 1
+            # Always keep the partition just built, even if it alone is over the bound
+            while self.resident_bytes > self.max_bytes and len(self.resident) > 1:
+                _, evicted = self.resident.popitem(last=False)
+                self.resident_bytes -= regions_nbytes(evicted)
+                self.evictions += 1
+        return regions
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, key):
+        return key in self.blocks
+
+    def stats(self):
+        with self.lock:
+            return {
+                "partitions": len(self.blocks),
+                "resident_partitions": len(self.resident),
+                "resident_regions": sum(len(regions['value']) for regions in self.resident.values()),
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "builds": self.builds,
+                "evictions": self.evictions,
+            }
+
+
+class EarningsRegions:
+    """Per-creator piecewise-constant predictions over the (brand_budget_usd, min_views_required) plane.
+
+    The tree's thresholds on the two request inputs cut the plane into a grid of cells. For every
+    class of creators that branch alike on their own features we store the rectangles of cells
+    that end in the same leaf, so scoring a request is a cell lookup and an interval test per
+    rectangle, with no model call.
+    """
+
+    def __init__(self, tree, partitions, features, max_bytes=DEFAULT_MAX_BYTES):
+        self.tree = tree
+        self.features = features
+        # Which axis each compact tree column belongs to, -1 for the creator's fixed inputs
+        self.column_axis = np.full(max(len(tree.columns), 1), -1, dtype=np.intp)
+        for j, column in enumerate(tree.columns):
+            if column['kind'] == NUMERIC and column['input'] in VARYING:
+                self.column_axis[j] = VARYING.index(column['input'])
+        node_axis = np.where(tree.children_left != TREE_LEAF, self.column_axis[tree.node_column], -1)
+        self.thresholds = [np.unique(tree.threshold[node_axis == axis]) for axis in range(len(VARYING))]
+        # Going left at a node means landing in a cell below its cut
+        self.node_axis = node_axis
+        self.node_cut = np.zeros(len(node_axis), dtype=np.intp)
+        for axis, thresholds in enumerate(self.thresholds):
+            on_axis = node_axis == axis
+            self.node_cut[on_axis] = np.searchsorted(thresholds, tree.threshold[on_axis]) + 1
+        # Built per partition on first use; the partitioned store replaces this with its own view
+        self.partitions = RegionCache(self.build, partitions, max_bytes)
+
+    def stats(self):
+        stats = getattr(self.partitions, 'stats', None)
+        return stats() if stats is not None else None
+
+    def decisions(self, X, chunk=65536):
+        """Pack each creator's branch at every split on a fixed input into a byte signature"""
+        tree = self.tree
+        fixed = (tree.children_left != TREE_LEAF) & (self.node_axis == -1)
+        columns, thresholds = tree.node_column[fixed], tree.threshold[fixed]
+        missing_left = tree.missing_go_to_left[fixed]
+        packed = []
+        for start in range(0, len(X), chunk):
+            x = X[start:start + chunk][:, columns]
+            packed.append(np.packbits(np.where(np.isnan(x), missing_left, x <= thresholds), axis=1))
+        return np.concatenate(packed)
+
+    def build(self, block):
+        tree = self.tree
+        X = tree.features(block.assign(**{name: 0.0 for name in VARYING})[self.features])
+        # Creators that branch the same way at every fixed split share their regions, so walk one per class
+        _, representatives, classes = np.unique(
+            self.decisions(X), axis=0, return_index=True, return_inverse=True)
+        X = X[representatives]
+        n = len(X)
+        row = np.arange(n)
+        node = np.zeros(n, dtype=np.intp)
+        lo = np.zeros((n, len(VARYING)), dtype=np.intp)
+        hi = np.tile(np.array([len(t) + 1 for t in self.thresholds], dtype=np.intp), (n, 1))
+        regions = []
+        # Walk every class down the tree at once; splits on a request input fork the walk
+        while row.size:
+            left = tree.children_left[node]
+            leaf = left == TREE_LEAF
+            if leaf.any():
+                regions.append((row[leaf], lo[leaf], hi[leaf], tree.value[node[leaf]]))
+            internal = ~leaf
+            row, node, lo, hi, left = row[internal], node[internal], lo[internal], hi[internal], left[internal]
+            right = tree.children_right[node]
+            axis = self.node_axis[node]
+
+            fixed = axis == -1
+            x = X[row[fixed], tree.node_column[node[fixed]]]
+            go_left = np.where(np.isnan(x), tree.missing_go_to_left[node[fixed]], x <= tree.threshold[node[fixed]])
+            fixed_next = np.where(go_left, left[fixed], right[fixed])
+
+            forked = ~fixed
+            f_row, f_axis, f_cut = row[forked], axis[forked], self.node_cut[node[forked]]
+            f_idx = np.arange(len(f_row))
+            left_hi = hi[forked].copy()
+            left_hi[f_idx, f_axis] = np.minimum(left_hi[f_idx, f_axis], f_cut)
+            right_lo = lo[forked].copy()
+            right_lo[f_idx, f_axis] = np.maximum(right_lo[f_idx, f_axis], f_cut)
+            left_ok = lo[forked][f_idx, f_axis] < left_hi[f_idx, f_axis]
+            right_ok = right_lo[f_idx, f_axis] < hi[forked][f_idx, f_axis]
+
+            row = np.concatenate([row[fixed], f_row[left_ok], f_row[right_ok]])
+            node = np.concatenate([fixed_next, left[forked][left_ok], right[forked][right_ok]])
+            lo = np.concatenate([lo[fixed], lo[forked][left_ok], right_lo[right_ok]])
+            hi = np.concatenate([hi[fixed], left_hi[left_ok], hi[forked][right_ok]])
+
+        rows, los, his, values = (np.concatenate(parts) for parts in zip(*regions))
+        return {"class": rows, "lo": los, "hi": his, "value": values,
+                "classes": classes.reshape(-1), "class_count": n}
+
+    def cells(self, request_values):
+        # sklearn compares float32 inputs with the thresholds, so the lookup does the same
+        return [
+            int(np.searchsorted(thresholds, np.float64(np.float32(value)), side='left'))
+            for thresholds, value in zip(self.thresholds, request_values)
+        ]
+
+    def predict(self, key, brand_budget_usd, min_views_required, positions=None):
+        """Predicted earnings for every creator in a partition block (or at `positions` in it), in block order"""
+        return self.predict_cells(key, self.cells((brand_budget_usd, min_views_required)), positions)
+
+    def predict_cells(self, key, cells, positions=None):
+        # Every request landing in the same cells gets exactly these predictions
+        regions = self.partitions[key]
+        hit = np.ones(len(regions['value']), dtype=bool)
+        for axis, cell in enumerate(cells):
+            hit &= (regions['lo'][:, axis] <= cell) & (cell < regions['hi'][:, axis])
+        class_values = np.empty(regions['class_count'], dtype=np.float64)
+        class_values[regions['class'][hit]] = regions['value'][hit]
+        classes = regions['classes'] if positions is None else regions['classes'][positions]
+        return class_values[classes]
+
+
+def build_regions(model, partitions, features, max_bytes=DEFAULT_MAX_BYTES):
+    """Precompute regions for the model when it is a tree we can compile; None means use model.predict"""
+    if isinstance(model, CompiledTree):
+        tree = model
+    else:
+        try:
+            tree = CompiledTree(*export_model(model))
+        except (ValueError, AttributeError):
+            return None
+    if any(column['kind'] != NUMERIC and column['input'] in VARYING for column in tree.columns):
+        return None
+    return EarningsRegions(tree, partitions, features, max_bytes)
@@ -4,18 +4,24 @@ import os
 import json
 import uuid
 from datetime import datetime
+import sys
 import threading
 from video_generator import VideoGenerator
 
+# The shared instrumentation module lives next to the other services, one directory up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from metrics import Metrics
+
 app = Flask(__name__)
 CORS(app)
+metrics = Metrics('video_generator').instrument(app)
 
 # Configuration
 UPLOAD_FOLDER = 'generated_videos'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Initialize video generator
-video_gen = VideoGenerator()
+# Initialize video generator; its pipeline stages are reported under the endpoint that started them
+video_gen = VideoGenerator(stage_timer=lambda name: metrics.stage(name, endpoint='/api/generate-video'))
 
 @app.route('/api/generate-video', methods=['POST'])
 def generate_video():
@@ -45,6 +51,7 @@ def generate_video():
         })
         
     except Exception as e:
+        metrics.count_error(e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/video-status/<video_id>', methods=['GET'])
@@ -53,6 +60,7 @@ def get_video_status(video_id):
         status = video_gen.get_generation_status(video_id)
         return jsonify(status)
     except Exception as e:
+        metrics.count_error(e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/download-video/<video_id>', methods=['GET'])
@@ -64,6 +72,7 @@ def download_video(video_id):
         else:
             return jsonify({'error': 'Video not found'}), 404
     except Exception as e:
+        metrics.count_error(e)
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
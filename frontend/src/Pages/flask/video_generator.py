@@ -1,6 +1,7 @@
 import os
 import json
 import subprocess
+from contextlib import nullcontext
 from datetime import datetime
 from PIL import Image, ImageDraw, ImageFont
 import cv2
@@ -10,8 +11,10 @@ import requests
 import torch
 
 class VideoGenerator:
-    def __init__(self):
+    def __init__(self, stage_timer=None):
         self.generation_status = {}
+        # Optional callable returning a context manager that times one pipeline stage
+        self.stage_timer = stage_timer or (lambda name: nullcontext())
         
         # Initialize AI models
         self.setup_models()
@@ -258,21 +261,24 @@ class VideoGenerator:
                 'progress': 20,
                 'message': 'Generating script...'
             })
-            script = self.generate_script(brand_data)
+            with self.stage_timer('script'):
+                script = self.generate_script(brand_data)
             
             # Step 2: Generate images
             self.generation_status[video_id].update({
                 'progress': 40,
                 'message': 'Creating visuals...'
             })
-            images = self.generate_images(brand_data, script)
+            with self.stage_timer('images'):
+                images = self.generate_images(brand_data, script)
             
             # Step 3: Create video
             self.generation_status[video_id].update({
                 'progress': 70,
                 'message': 'Composing video...'
             })
-            video_path = self.create_video(brand_data, script, images, video_id)
+            with self.stage_timer('encode'):
+                video_path = self.create_video(brand_data, script, images, video_id)
             
             if video_path and os.path.exists(video_path):
                 self.generation_status[video_id].update({
@@ -0,0 +1,369 @@
+import argparse
+import gzip
+import http.client
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+import numpy as np
+
+YOUTUBE_URL = 'https://www.youtube.com'
+# A desktop browser's headers, English text (the counts are matched on "subscribers" and "videos")
+# and the cookie that skips the EU consent interstitial
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip',
+    'Cookie': 'SOCS=CAI',
+}
+INITIAL_DATA = re.compile(r'(?:var ytInitialData|window\["ytInitialData"\])\s*=\s*')
+# A count as the header shows it, e.g. "2.31M subscribers" or "1,204 videos"
+COUNT_TEXT = re.compile(r'^\s*\d[\d.,]*\s*[KMB]?\s+(subscribers|videos)\s*$', re.IGNORECASE)
+# Renderers of one video in a channel's videos grid, newest layout last
+VIDEO_RENDERERS = ('videoRenderer', 'gridVideoRenderer', 'lockupViewModel')
+
+
+class ExtractionError(Exception):
+    """The page could not be fetched or did not have the data where expected"""
+
+
+class HttpPool:
+    """Keep-alive connections per host, reused across requests and threads"""
+
+    def __init__(self, timeout=10.0, max_idle=16):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.reuses = 0
+
+    def connect(self, scheme, netloc):
+        with self.lock:
+            connections = self.idle.get((scheme, netloc))
+            if connections:
+                self.reuses += 1
+                return connections.pop(), True
+            self.connects += 1
+        kind = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return kind(netloc, timeout=self.timeout), False
+
+    def release(self, scheme, netloc, connection):
+        with self.lock:
+            connections = self.idle.setdefault((scheme, netloc), [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def get(self, url):
+        """(status, body) of a GET, with gzip undone"""
+        parts = urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        while True:
+            connection, reused = self.connect(parts.scheme, parts.netloc)
+            try:
+                connection.request('GET', path, headers=HEADERS)
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                # The server may have dropped an idle connection; retry once on a fresh one
+                if not reused:
+                    raise
+        if response.will_close:
+            connection.close()
+        else:
+            self.release(parts.scheme, parts.netloc, connection)
+        if response.getheader('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return response.status, body
+
+    def stats(self):
+        with self.lock:
+            return {"connects": self.connects, "reuses": self.reuses,
+                    "idle": sum(len(connections) for connections in self.idle.values())}
+
+
+def initial_data(html):
+    """The ytInitialData object the page embeds for its own rendering"""
+    match = INITIAL_DATA.search(html)
+    if match is None:
+        raise ExtractionError("No ytInitialData in the page")
+    try:
+        data, _ = json.JSONDecoder().raw_decode(html, match.end())
+    except ValueError as e:
+        raise ExtractionError(f"Unreadable ytInitialData: {e}")
+    return data
+
+
+def text_of(node):
+    """The display string of a text node in any of the shapes YouTube uses, or None"""
+    if isinstance(node, dict):
+        if isinstance(node.get('simpleText'), str):
+            return node['simpleText']
+        if isinstance(node.get('content'), str):
+            return node['content']
+        if isinstance(node.get('runs'), list):
+            return ''.join(run.get('text', '') for run in node['runs'] if isinstance(run, dict))
+    return None
+
+
+def texts(node):
+    """Every display string under `node`, in page order"""
+    text = text_of(node)
+    if text is not None:
+        yield text
+    elif isinstance(node, dict):
+        for value in node.values():
+            yield from texts(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from texts(value)
+
+
+def first_renderer(node, names):
+    """The first object under `node`, in page order, held by one of the keys in `names`"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in names and isinstance(value, dict):
+                return value
+            found = first_renderer(value, names)
+            if found is not None:
+                return found
+    elif isinstance(node, list):
+        for value in node:
+            found = first_renderer(value, names)
+            if found is not None:
+                return found
+    return None
+
+
+def header_counts(data):
+    """Subscriber and video count texts from the channel header's metadata, not its title or handle"""
+    header = data.get('header')
+    if not header:
+        raise ExtractionError("No channel header in ytInitialData")
+    metadata = first_renderer(header, ('contentMetadataViewModel',))
+    if metadata is not None:
+        candidates = list(texts(metadata))
+    else:
+        # The older header keeps each count in its own field
+        c4 = first_renderer(header, ('c4TabbedHeaderRenderer',)) or {}
+        candidates = [text_of(c4.get('subscriberCountText')), text_of(c4.get('videosCountText'))]
+    counts = {}
+    for text in candidates:
+        match = COUNT_TEXT.match(text or '')
+        if match is not None:
+            counts.setdefault(match.group(1).lower(), text)
+    if not counts:
+        raise ExtractionError("No subscriber or video count in the channel header")
+    return counts.get('subscribers', "Not Found"), counts.get('videos', "Not Found")
+
+
+def latest_video(data):
+    """Views and upload age of the first video on the videos tab, as the page shows them"""
+    if 'contents' not in data:
+        raise ExtractionError("No tab contents in ytInitialData")
+    video = first_renderer(data['contents'], VIDEO_RENDERERS)
+    if video is None:
+        return "Not found", "Not found"
+    if 'publishedTimeText' in video:
+        views = text_of(video.get('shortViewCountText')) or text_of(video.get('viewCountText')) or "Not found"
+        return views, text_of(video['publishedTimeText']) or "Not found"
+    parts = list(texts(video.get('metadata', {})))
+    views = next((text for text in parts if 'view' in text.lower()), "Not found")
+    upload = next((text for text in parts if 'ago' in text.lower() or 'streamed' in text.lower()), "Not found")
+    return views, upload
+
+
+class HttpExtractor:
+    """Reads a channel's counts and latest video from the pages' embedded JSON, without a browser.
+
+    The home and videos pages are fetched in parallel over pooled keep-alive connections.
+    ExtractionError means the pages could not be fetched or were not what the parser expects;
+    callers fall back to the browser for those.
+    """
+
+    def __init__(self, base_url=YOUTUBE_URL, timeout=10.0, workers=16):
+        self.base_url = base_url.rstrip('/')
+        self.client = HttpPool(timeout)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-extract')
+
+    def page(self, url):
+        try:
+            status, body = self.client.get(url)
+        except (OSError, http.client.HTTPException) as e:
+            raise ExtractionError(f"Could not fetch {url}: {e}")
+        if status != 200:
+            raise ExtractionError(f"HTTP {status} from {url}")
+        return initial_data(body.decode('utf-8', errors='replace'))
+
+    def extract(self, channel):
+        home_url = f"{self.base_url}/@{quote(channel.strip().lstrip('@'), safe='')}"
+        home, videos = self.executor.map(self.page, [home_url, f"{home_url}/videos"])
+        subscribers, video_count = header_counts(home)
+        latest_views, latest_upload = latest_video(videos)
+        return {"subscribers": subscribers, "videos": video_count,
+                "latestViews": latest_views, "latestUpload": latest_upload}
+
+
+def fixture_file(path):
+    # /@Name -> @name.html, /@Name/videos -> @name.videos.html; handles are case-insensitive
+    name = unquote(path.split('?')[0]).strip('/').lower()
+    return name.replace('/', '.') + '.html'
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """Serves saved channel pages under the URLs YouTube uses for them"""
+
+    # Keep-alive, as YouTube does, so the benchmark measures pooled connections
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without this delayed ACKs add ~40ms to each
+    disable_nagle_algorithm = True
+
+    def translate_path(self, path):
+        return os.path.join(self.directory, fixture_file(path))
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_fixtures(directory, port=0):
+    """Start a local server for a fixtures directory; returns it and its base URL"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), lambda *a, **kw: FixtureHandler(*a, directory=directory, **kw))
+    threading.Thread(target=server.serve_forever, name='fixtures', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def read_expected(directory):
+    with open(os.path.join(directory, 'expected.json')) as f:
+        return json.load(f)
+
+
+def check(directory):
+    """Run the HTTP engine against the fixtures offline; returns the channels whose fields differ"""
+    server, base_url = serve_fixtures(directory)
+    try:
+        extractor = HttpExtractor(base_url)
+        failures = {}
+        for channel, expected in read_expected(directory).items():
+            try:
+                actual = extractor.extract(channel)
+            except ExtractionError as e:
+                actual = {"error": str(e)}
+            if actual != expected:
+                failures[channel] = {"expected": expected, "actual": actual}
+        return failures
+    finally:
+        server.shutdown()
+
+
+def save(directory, channel, base_url=YOUTUBE_URL):
+    """Save a channel's live pages as fixtures, with what the HTTP engine reads from them as expected"""
+    os.makedirs(directory, exist_ok=True)
+    client = HttpPool()
+    home_url = f"{base_url}/@{quote(channel.strip().lstrip('@'), safe='')}"
+    for url in (home_url, f"{home_url}/videos"):
+        status, body = client.get(url)
+        if status != 200:
+            raise ExtractionError(f"HTTP {status} from {url}")
+        with open(os.path.join(directory, fixture_file(urlsplit(url).path)), 'wb') as f:
+            f.write(body)
+    server, fixtures_url = serve_fixtures(directory)
+    try:
+        fields = HttpExtractor(fixtures_url).extract(channel)
+    finally:
+        server.shutdown()
+    path = os.path.join(directory, 'expected.json')
+    expected = read_expected(directory) if os.path.exists(path) else {}
+    expected[channel] = fields
+    with open(path, 'w') as f:
+        json.dump(expected, f, indent=2)
+    return fields
+
+
+def summarize(timings, cpu):
+    p50, p99 = np.percentile(timings, [50, 99]) * 1000
+    return {"runs": len(timings), "p50_ms": p50, "p99_ms": p99, "cpu_ms_per_run": cpu / len(timings) * 1000}
+
+
+def bench_http(channels, base_url, repeat):
+    extractor = HttpExtractor(base_url)
+    timings = []
+    cpu = time.process_time()
+    for _ in range(repeat):
+        for channel in channels:
+            start = time.perf_counter()
+            extractor.extract(channel)
+            timings.append(time.perf_counter() - start)
+    return {**summarize(timings, time.process_time() - cpu), **extractor.client.stats()}
+
+
+def bench_selenium(channels, base_url, repeat):
+    # Through app2's own pool and page steps; browser CPU is read from Chrome's processes
+    os.environ.update(ANALYZE_ENGINE='selenium', ANALYZE_YOUTUBE_URL=base_url, ANALYZE_POOL_SIZE='1')
+    import app2
+    from procfs import cpu_seconds, process_tree
+
+    entry = app2.pool.checkout()
+    timings = []
+    try:
+        pids = process_tree(entry.driver.service.process.pid)
+        cpu = time.process_time() + cpu_seconds(pids)
+        for _ in range(repeat):
+            for channel in channels:
+                start = time.perf_counter()
+                app2.browser_fields(entry.driver, channel, {})
+                timings.append(time.perf_counter() - start)
+        cpu = time.process_time() + cpu_seconds(process_tree(entry.driver.service.process.pid)) - cpu
+    finally:
+        app2.pool.checkin(entry)
+    return summarize(timings, cpu)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Browserless channel extraction: fixtures and benchmark')
+    parser.add_argument('command', choices=['check', 'save', 'bench'])
+    parser.add_argument('--fixtures', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'youtube'))
+    parser.add_argument('--channel', nargs='+', default=[])
+    parser.add_argument('--engines', nargs='+', choices=['http', 'selenium'], default=['http'])
+    parser.add_argument('--base-url', help='benchmark against this site instead of the fixtures')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == 'check':
+        failures = check(args.fixtures)
+        print(json.dumps(failures, indent=2) if failures else f"All fixtures in {args.fixtures} extracted as expected")
+        sys.exit(1 if failures else 0)
+    elif args.command == 'save':
+        for channel in args.channel:
+            print(channel, json.dumps(save(args.fixtures, channel)))
+    else:
+        channels = args.channel or [channel for channel, expected in read_expected(args.fixtures).items()
+                                    if 'error' not in expected]
+        server = None
+        base_url = args.base_url
+        if base_url is None:
+            # The fixtures only hold the HTML; a browser would render them without YouTube's scripts
+            server, base_url = serve_fixtures(args.fixtures)
+        try:
+            results = {}
+            for engine in args.engines:
+                run = bench_http if engine == 'http' else bench_selenium
+                results[engine] = run(channels, base_url, args.repeat)
+        finally:
+            if server is not None:
+                server.shutdown()
+        print(json.dumps({"base_url": base_url, "channels": channels, **results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
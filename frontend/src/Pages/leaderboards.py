@@ -0,0 +1,185 @@
+import math
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from catalog import FEATURES
+
+# Budgets precomputed when the model has no regions; only briefs asking for exactly these are covered
+DEFAULT_BUDGETS = (1000.0, 5000.0, 10000.0, 25000.0, 50000.0, 100000.0, 250000.0, 500000.0)
+DEFAULT_MIN_VIEWS = (0.0,)
+
+
+def top_positions(values, k):
+    """Positions of the k largest values, ties in block order, matching a stable descending sort"""
+    if len(values) > k:
+        kth = np.partition(values, len(values) - k)[len(values) - k]
+        candidates = np.flatnonzero(values >= kth)
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.argsort(-values[candidates], kind='stable')][:k]
+
+
+class Leaderboards:
+    """Top-k creators for every (country, channel_type, budget bucket), rebuilt in the background.
+
+    With precomputed earnings regions a budget bucket is one cell of the tree's budget thresholds,
+    so a board is exactly what an on-demand request anywhere in that cell would return, for each
+    configured min_views_required. Without regions the buckets are the `budgets` themselves.
+    Boards are tied to the catalog version they were built from and are never served for another.
+    """
+
+    def __init__(self, columns, k, min_views=DEFAULT_MIN_VIEWS, budgets=DEFAULT_BUDGETS):
+        self.columns = columns
+        self.k = k
+        self.min_views = tuple(float(v) for v in min_views)
+        self.budgets = tuple(float(b) for b in budgets)
+        # (catalog version, boards) replaced as one object, so a lookup never mixes two versions
+        self.table = (None, {})
+        self.base_version = None
+        self.partitions_built = None
+        self.built_at = None
+        self.build_seconds = None
+        self.last_error = None
+        self.hits = 0
+        self.misses = 0
+        self.pending = None
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self, reloader):
+        """Build for the current catalog, then again after every reload, on a daemon thread"""
+        reloader.subscribe(self.schedule)
+        self.schedule(reloader.current)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='leaderboards', daemon=True)
+            self.thread.start()
+
+    def after_fork(self):
+        """Keep building in a forked worker, which inherits neither the thread nor a usable lock"""
+        if self.thread is not None:
+            self.condition = threading.Condition()
+            self.pending = None
+            self.thread = threading.Thread(target=self.run, name='leaderboards', daemon=True)
+            self.thread.start()
+
+    def schedule(self, catalog):
+        # Only the newest catalog matters; one still waiting is simply replaced
+        with self.condition:
+            self.pending = catalog
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                catalog, self.pending = self.pending, None
+            try:
+                self.refresh(catalog)
+            except Exception as e:
+                self.last_error = str(e)
+
+    def wait(self, version, timeout=None):
+        """Block until boards for `version` are built; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.table[0] != version:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def refresh(self, catalog):
+        start = time.perf_counter()
+        base_version = getattr(catalog, 'base_version', None)
+        version, boards = self.table
+        if base_version is not None and base_version == self.base_version and version is not None:
+            # A delta-log update of the catalog these boards came from: only its changed partitions differ
+            boards = {key: board for key, board in boards.items() if key[:2] not in catalog.changed}
+            boards.update(self.build(catalog, catalog.changed))
+            built = len(catalog.changed)
+        else:
+            boards = self.build(catalog)
+            built = len(catalog.partitions)
+        with self.condition:
+            self.table = (catalog.version, boards)
+            self.base_version = base_version
+            self.partitions_built = built
+            self.built_at = datetime.now().isoformat(timespec='seconds')
+            self.build_seconds = time.perf_counter() - start
+            self.last_error = None
+            self.condition.notify_all()
+
+    def build(self, catalog, partitions=None):
+        boards = {}
+        regions = catalog.regions
+        if partitions is None:
+            partitions = catalog.partitions
+        for partition in partitions:
+            block = catalog.partitions.get(partition)
+            if block is None:
+                continue
+            # Pulled out of the frame once per partition, so each board is a few array lookups
+            arrays = {column: block[column].to_numpy() for column in self.columns if column != 'predicted_earning'}
+            if regions is not None:
+                budget_cells = range(len(regions.thresholds[0]) + 1)
+                views_cells = sorted({regions.cells((0.0, views))[1] for views in self.min_views})
+                for views_cell in views_cells:
+                    for budget_cell in budget_cells:
+                        values = regions.predict_cells(partition, (budget_cell, views_cell))
+                        boards[partition + (budget_cell, views_cell)] = self.board(arrays, values)
+            else:
+                for views in self.min_views:
+                    for budget in self.budgets:
+                        candidates = block.assign(brand_budget_usd=budget, min_views_required=views)
+                        values = np.asarray(catalog.model.predict(candidates[FEATURES]), dtype=np.float64)
+                        boards[partition + (budget, views)] = self.board(arrays, values)
+        return boards
+
+    def board(self, arrays, values):
+        # Same rows and Python scalars as serialization.records on the ranked frame
+        top = top_positions(values, self.k)
+        columns = {column: array[top].tolist() for column, array in arrays.items()}
+        columns['predicted_earning'] = values[top].tolist()
+        return [dict(zip(self.columns, row)) for row in zip(*(columns[column] for column in self.columns))]
+
+    def lookup(self, catalog, partition, brand_budget_usd, min_views_required, k):
+        """The precomputed top-k for this brief, or None when it is not covered"""
+        board = None
+        version, boards = self.table
+        if k <= self.k and version == catalog.version:
+            if catalog.regions is not None:
+                if math.isfinite(brand_budget_usd) and math.isfinite(min_views_required):
+                    cells = catalog.regions.cells((brand_budget_usd, min_views_required))
+                    board = boards.get(partition + tuple(cells))
+            else:
+                board = boards.get(partition + (brand_budget_usd, min_views_required))
+        with self.condition:
+            if board is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if board is None else board[:k]
+
+    def stats(self):
+        with self.condition:
+            lookups = self.hits + self.misses
+            version, boards = self.table
+            return {
+                "version": version,
+                "boards": len(boards),
+                "k": self.k,
+                "min_views": list(self.min_views),
+                "built_at": self.built_at,
+                "build_seconds": self.build_seconds,
+                "partitions_built": self.partitions_built,
+                "pending": self.pending is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "last_error": self.last_error,
+            }
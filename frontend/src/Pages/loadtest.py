@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from catalog import FEATURES, read_dataset
+from serve import load_briefs, post_json, wait_ready
+
+SIZES = {'100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+
+
+def format_views(values):
+    # Same shape as the scraped column ("228.0B", "12.3M", "512"), so ingest is exercised too
+    out = np.where(values >= 1e9, np.char.add(np.char.mod('%.1f', values / 1e9), 'B'),
+          np.where(values >= 1e6, np.char.add(np.char.mod('%.1f', values / 1e6), 'M'),
+          np.where(values >= 1e3, np.char.add(np.char.mod('%.1f', values / 1e3), 'K'),
+                   np.char.mod('%d', values))))
+    return out
+
+
+def generate_catalog(data_path, rows, out_path, seed=0, chunk=1_000_000):
+    """Expand the seed catalog to `rows` creators, keeping its country/channel_type mix.
+
+    Rows are bootstrapped from the seed, so the joint skew of country, channel_type and the
+    numeric columns is preserved, then audience and earnings figures get log-normal noise.
+    """
+    seed_data, _ = read_dataset(data_path)
+    rng = np.random.default_rng(seed)
+    scaled = ['subscribers', 'video_views', 'video_views_for_the_last_30_days',
+              'lowest_monthly_earnings', 'highest_monthly_earnings',
+              'lowest_yearly_earnings', 'highest_yearly_earnings']
+    written = 0
+    with open(out_path, 'w', newline='') as f:
+        while written < rows:
+            n = min(chunk, rows - written)
+            block = seed_data.iloc[rng.integers(0, len(seed_data), n)].reset_index(drop=True)
+            noise = rng.lognormal(0.0, 0.35, size=(n, 1))
+            for column in scaled:
+                block[column] = np.round(block[column].to_numpy() * noise[:, 0], 2)
+            block['rank'] = np.arange(written + 1, written + n + 1)
+            block['youtuber'] = block['youtuber'].astype(str) + '_' + block['rank'].astype(str)
+            block['video_views'] = format_views(block['video_views'].fillna(0).to_numpy())
+            block.to_csv(f, header=written == 0, index=False)
+            written += n
+    return out_path
+
+
+def train_stand_in_model(data_path, out_path, max_depth=10):
+    """A tree with the production model's inputs, for when the real joblib is not available"""
+    import joblib
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+    from sklearn.tree import DecisionTreeRegressor
+
+    data, _ = read_dataset(data_path)
+    data = data.dropna(subset=['earning_of_brand_through_deal_usd'])
+    model = Pipeline([
+        ('prep', ColumnTransformer(
+            [('cat', OneHotEncoder(handle_unknown='ignore'), ['country', 'product_category'])],
+            remainder='passthrough')),
+        ('tree', DecisionTreeRegressor(max_depth=max_depth, random_state=0)),
+    ])
+    model.fit(data[FEATURES], data['earning_of_brand_through_deal_usd'])
+    joblib.dump(model, out_path)
+    return out_path
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": max(latencies) * 1000}
+
+
+def open_loop(url, bodies, rate, duration, concurrency=256, seed=0):
+    """Send requests on a Poisson arrival schedule that does not wait for responses.
+
+    Latency is measured from each request's scheduled start, so time spent queued behind a
+    slow server counts against it instead of silently lowering the offered load.
+    """
+    rng = random.Random(seed)
+    arrivals, t = [], 0.0
+    while t < duration:
+        t += rng.expovariate(rate)
+        arrivals.append(t)
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def send(scheduled, body):
+        try:
+            post_json(url, body)
+            ok = True
+        except (urllib.error.URLError, OSError) as e:
+            ok, error = False, str(e)
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors.append(error)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for offset in arrivals:
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, scheduled, rng.choice(bodies))
+    wall = time.perf_counter() - start
+    return {
+        "offered_rps": rate,
+        "achieved_rps": len(latencies) / wall,
+        "requests": len(arrivals),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        **percentiles(latencies),
+    }
+
+
+def batch_bodies(briefs, batch_size, count=50, seed=0):
+    rng = random.Random(seed)
+    return [{"briefs": rng.sample(briefs, min(batch_size, len(briefs)))} for _ in range(count)]
+
+
+def start_server(env, port, workers):
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.join(here, 'serve.py'), '--workers', str(workers),
+               '--port', str(port), '--report-interval', '0', '--max-requests', '0']
+    server = subprocess.Popen(command, env=env, cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_ready(f'http://127.0.0.1:{port}/recommend/version', timeout=1800)
+    return server
+
+
+def run_suite(args):
+    from snapshot import build_snapshot
+
+    os.makedirs(args.workdir, exist_ok=True)
+    model_path = args.model
+    if not os.path.exists(model_path):
+        model_path = os.path.join(args.workdir, 'stand_in_model.joblib')
+        if not os.path.exists(model_path):
+            print(f"{args.model} not found, training a stand-in model")
+            train_stand_in_model(args.data, model_path)
+
+    results = {
+        "started_at": datetime.now().isoformat(timespec='seconds'),
+        "git_rev": git_rev(),
+        "model": model_path,
+        "workers": args.workers,
+        "duration_s": args.duration,
+        "runs": [],
+    }
+    for size in args.sizes:
+        csv_path = os.path.join(args.workdir, f'catalog_{size}.csv')
+        if not os.path.exists(csv_path):
+            print(f"Generating {SIZES[size]} creators into {csv_path}")
+            generate_catalog(args.data, SIZES[size], csv_path)
+        snapshot_dir = os.path.join(args.workdir, f'catalog_{size}.snapshot')
+        build_snapshot(csv_path, model_path, snapshot_dir)
+
+        env = dict(os.environ, RECOMMEND_SNAPSHOT_PATH=snapshot_dir,
+                   RECOMMEND_CACHE_SIZE=str(args.cache_size))
+        started = time.perf_counter()
+        server = start_server(env, args.port, args.workers)
+        startup_s = time.perf_counter() - started
+        try:
+            base = f'http://127.0.0.1:{args.port}'
+            briefs = load_briefs(args.data, count=500)
+            scenarios = [("single", base + '/recommend', briefs, rate) for rate in args.rates]
+            scenarios += [(f"batch{args.batch_size}", base + '/recommend/batch',
+                           batch_bodies(briefs, args.batch_size), rate) for rate in args.batch_rates]
+            for name, url, bodies, rate in scenarios:
+                print(f"{size} {name} @ {rate} rps")
+                run = open_loop(url, bodies, rate, args.duration)
+                results["runs"].append({"catalog": size, "rows": SIZES[size], "scenario": name,
+                                        "startup_s": startup_s, **run})
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {len(results['runs'])} runs to {args.out}")
+    return results
+
+
+def git_rev():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path):
+    """Per-scenario change in tail latency and throughput between two result files"""
+    def index(path):
+        with open(path) as f:
+            return {(r['catalog'], r['scenario'], r['offered_rps']): r for r in json.load(f)['runs']}
+
+    before, after = index(before_path), index(after_path)
+    rows = []
+    for key in sorted(before.keys() & after.keys()):
+        row = {"catalog": key[0], "scenario": key[1], "offered_rps": key[2]}
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'achieved_rps'):
+            a, b = before[key][metric], after[key][metric]
+            row[metric] = {"before": a, "after": b, "change": (b - a) / a if a and b is not None else None}
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load tests for the recommendation API')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    gen = sub.add_parser('catalog', help='expand final.csv into a synthetic catalog')
+    gen.add_argument('--data', default='final.csv')
+    gen.add_argument('--size', choices=sorted(SIZES), default='100k')
+    gen.add_argument('--out', required=True)
+
+    model = sub.add_parser('model', help='train a stand-in model with the production inputs')
+    model.add_argument('--data', default='final.csv')
+    model.add_argument('--out', default='stand_in_model.joblib')
+
+    run = sub.add_parser('run', help='open-loop load against a running server')
+    run.add_argument('--url', default='http://127.0.0.1:5001')
+    run.add_argument('--data', default='final.csv')
+    run.add_argument('--rate', type=float, default=50)
+    run.add_argument('--duration', type=float, default=30)
+    run.add_argument('--batch-size', type=int, default=0, help='send /recommend/batch with this many briefs')
+
+    suite = sub.add_parser('suite', help='generate catalogs, start servers and record every scenario')
+    suite.add_argument('--data', default='final.csv')
+    suite.add_argument('--model', default='creator_recommendation_model.joblib')
+    suite.add_argument('--sizes', nargs='+', choices=sorted(SIZES), default=['100k'])
+    suite.add_argument('--workdir', default='loadtest_work')
+    suite.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    suite.add_argument('--port', type=int, default=5091)
+    suite.add_argument('--rates', type=float, nargs='+', default=[25, 50, 100])
+    suite.add_argument('--batch-rates', type=float, nargs='+', default=[5, 10])
+    suite.add_argument('--batch-size', type=int, default=25)
+    suite.add_argument('--duration', type=float, default=20)
+    suite.add_argument('--cache-size', type=int, default=0)
+    suite.add_argument('--out', default='loadtest_results.json')
+
+    cmp = sub.add_parser('compare', help='diff two suite result files')
+    cmp.add_argument('before')
+    cmp.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'catalog':
+        generate_catalog(args.data, SIZES[args.size], args.out)
+    elif args.command == 'model':
+        train_stand_in_model(args.data, args.out)
+    elif args.command == 'run':
+        briefs = load_briefs(args.data, count=500)
+        if args.batch_size:
+            url, bodies = args.url + '/recommend/batch', batch_bodies(briefs, args.batch_size)
+        else:
+            url, bodies = args.url + '/recommend', briefs
+        print(json.dumps(open_loop(url, bodies, args.rate, args.duration), indent=2))
+    elif args.command == 'suite':
+        run_suite(args)
+    else:
+        print(json.dumps(compare(args.before, args.after), indent=2))
+
+
+if __name__ == '__main__':
+    main()
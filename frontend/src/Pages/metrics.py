@@ -0,0 +1,160 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+
+# Seconds; wide enough for sub-millisecond cache hits and minute-long video renders
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{escape(value)}"' for name, value in labels)
+
+
+class Metrics:
+    """Per-endpoint latency histograms, per-stage timers and in-flight gauges for one Flask service.
+
+    Everything is plain counters behind a single lock, so it is cheap enough to leave on, and is
+    rendered in the Prometheus text format on /metrics.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.stages = {}
+        self.requests = {}
+        self.errors = {}
+        self.in_flight = {}
+        self.local = threading.local()
+
+    def instrument(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view, methods=['GET'])
+        return self
+
+    def endpoint(self):
+        # The URL rule, not the path, so ids in paths do not create a series per request
+        if has_request_context():
+            return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        return getattr(self.local, 'endpoint', '')
+
+    @contextmanager
+    def bound(self, endpoint):
+        """Attribute stages and errors timed on this thread, outside any request, to `endpoint`"""
+        previous = getattr(self.local, 'endpoint', '')
+        self.local.endpoint = endpoint
+        try:
+            yield
+        finally:
+            self.local.endpoint = previous
+
+    def before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_endpoint = self.endpoint()
+        with self.lock:
+            self.in_flight[g.metrics_endpoint] = self.in_flight.get(g.metrics_endpoint, 0) + 1
+
+    def observe(self, key, status, start):
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latency.setdefault(key, Histogram()).observe(elapsed)
+            status_key = key + (status,)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+
+    def leave(self, endpoint):
+        with self.lock:
+            self.in_flight[endpoint] -= 1
+
+    def after_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+        key = (g.metrics_endpoint, request.method)
+        if response.is_streamed:
+            # The body is produced after this hook returns; the request ends when the stream closes.
+            # Taking the endpoint from g leaves teardown_request nothing to decrement.
+            endpoint, start, status = g.pop('metrics_endpoint'), g.metrics_start, response.status_code
+
+            def close():
+                self.observe(key, status, start)
+                self.leave(endpoint)
+
+            response.call_on_close(close)
+        else:
+            self.observe(key, response.status_code, g.metrics_start)
+        return response
+
+    def teardown_request(self, exc):
+        # Runs even when a view raises, so the gauge never drifts upwards
+        endpoint = g.pop('metrics_endpoint', None)
+        if endpoint is not None:
+            self.leave(endpoint)
+
+    @contextmanager
+    def stage(self, name, endpoint=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            key = (self.endpoint() if endpoint is None else endpoint, name)
+            with self.lock:
+                self.stages.setdefault(key, Histogram()).observe(elapsed)
+
+    def count_error(self, exc, endpoint=None):
+        key = (self.endpoint() if endpoint is None else endpoint, type(exc).__name__)
+        with self.lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def render_histogram(self, lines, name, series, label_names):
+        lines.append(f'# TYPE {name} histogram')
+        for key, histogram in sorted(series.items()):
+            labels = [('service', self.service)] + list(zip(label_names, key))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{{format_labels(labels + [("le", le)])}}} {cumulative}')
+            lines.append(f'{name}_sum{{{format_labels(labels)}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{format_labels(labels)}}} {histogram.count}')
+
+    def render_simple(self, lines, name, kind, series, label_names):
+        lines.append(f'# TYPE {name} {kind}')
+        for key, value in sorted(series.items()):
+            labels = [('service', self.service)] + list(zip(label_names, key if isinstance(key, tuple) else (key,)))
+            lines.append(f'{name}{{{format_labels(labels)}}} {value}')
+
+    def render(self):
+        lines = []
+        with self.lock:
+            self.render_histogram(lines, 'http_request_duration_seconds', self.latency, ('endpoint', 'method'))
+            self.render_simple(lines, 'http_requests_total', 'counter', self.requests, ('endpoint', 'method', 'status'))
+            self.render_simple(lines, 'http_requests_in_flight', 'gauge', self.in_flight, ('endpoint',))
+            self.render_histogram(lines, 'stage_duration_seconds', self.stages, ('endpoint', 'stage'))
+            self.render_simple(lines, 'handler_errors_total', 'counter', self.errors, ('endpoint', 'exception'))
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
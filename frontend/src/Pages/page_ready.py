@@ -0,0 +1,31 @@
+import time
+
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+
+class PageNotReady(Exception):
+    """Counted when what a step reads has not shown up by its deadline"""
+
+
+def wait_for_texts(driver, xpath, ready, timeout, poll=0.1):
+    """Texts of the elements at `xpath` as soon as `ready(texts)` holds, or whatever is there at the deadline.
+
+    Returns (texts, seconds waited, whether they became ready). The texts are read while
+    polling, so a re-render after the check cannot make the extraction see stale elements.
+    """
+    texts = []
+
+    def check(driver):
+        texts[:] = [element.text for element in driver.find_elements(By.XPATH, xpath)]
+        return ready(texts)
+
+    start = time.perf_counter()
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=poll,
+                      ignored_exceptions=(StaleElementReferenceException,)).until(check)
+        done = True
+    except TimeoutException:
+        done = False
+    return list(texts), time.perf_counter() - start, done
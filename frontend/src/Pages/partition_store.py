@@ -0,0 +1,339 @@
+import argparse
+import json
+import os
+import pickle
+import resource
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import datetime
+from functools import partial
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from catalog import FEATURES, load_model, parse_views
+from coalesce import SingleFlight
+from compiled_model import compile_model, save_compiled
+from earnings_regions import build_regions
+from range_index import RangeIndex
+
+MANIFEST = 'manifest.json'
+FORMAT = 'partitioned-1'
+SPILL = 'spill.pkl'
+
+
+def partition_keys(frame):
+    return frame['country'].str.lower(), frame['channel_type'].str.lower()
+
+
+def spill_chunks(data_path, work_dir, chunk_rows):
+    """Pass 1: stream the CSV and append each chunk's rows to a spill file per partition"""
+    directories = {}
+    kinds = {}
+    rows = malformed = 0
+    sample = None
+    for chunk in pd.read_csv(data_path, chunksize=chunk_rows):
+        chunk['video_views'], bad = parse_views(chunk['video_views'])
+        malformed += bad
+        rows += len(chunk)
+        for name in chunk.columns:
+            column = chunk[name]
+            # A column that is all missing in a chunk says nothing about its kind; the first values decide
+            if not column.notna().any():
+                continue
+            kind = 'numeric' if pd.api.types.is_numeric_dtype(column) else 'string'
+            if kinds.setdefault(name, kind) != kind:
+                raise ValueError(f"Column {name} mixes numbers and text in {data_path}")
+        if sample is None:
+            sample = chunk
+        # Same grouping as build_partition_index: case-folded keys, rows with a missing key dropped
+        for key, block in chunk.groupby(list(partition_keys(chunk)), sort=False):
+            directory = directories.setdefault(key, f'p{len(directories):05d}')
+            os.makedirs(os.path.join(work_dir, directory), exist_ok=True)
+            with open(os.path.join(work_dir, directory, SPILL), 'ab') as f:
+                pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+    kinds = {name: kinds.get(name, 'numeric') for name in sample.columns}
+    return directories, kinds, rows, malformed, sample
+
+
+def read_spill(path):
+    blocks = []
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                blocks.append(pickle.load(f))
+            except EOFError:
+                return pd.concat(blocks)
+
+
+def write_partition(directory, block, kinds):
+    """Pass 2: one partition's columns as .npy files, strings dictionary-encoded like the snapshot"""
+    for name, kind in kinds.items():
+        series = block[name]
+        if kind == 'numeric':
+            np.save(os.path.join(directory, f'{name}.npy'), series.to_numpy(dtype=np.float64), allow_pickle=False)
+        else:
+            codes, values = pd.factorize(series, use_na_sentinel=True)
+            np.save(os.path.join(directory, f'{name}.codes.npy'), codes.astype(np.int32), allow_pickle=False)
+            np.save(os.path.join(directory, f'{name}.values.npy'), np.asarray(values, dtype=str), allow_pickle=False)
+
+
+def build_partitioned(data_path, model_path, out_dir, chunk_rows=500_000):
+    """Partition the catalog on disk by (country, channel_type) without ever holding all of it in memory.
+
+    Peak memory is one CSV chunk during the first pass and the largest partition during the second.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    # Every build gets its own directory and the manifest is replaced last, as in the snapshot
+    build = uuid.uuid4().hex[:8]
+    build_dir = os.path.join(out_dir, build)
+    directories, kinds, rows, malformed, sample = spill_chunks(data_path, build_dir, chunk_rows)
+    partitions = []
+    for key, directory in directories.items():
+        path = os.path.join(build_dir, directory)
+        block = read_spill(os.path.join(path, SPILL))
+        write_partition(path, block, kinds)
+        os.remove(os.path.join(path, SPILL))
+        partitions.append({"key": list(key), "dir": directory, "rows": len(block)})
+
+    model = joblib.load(model_path)
+    joblib.dump(model, os.path.join(build_dir, 'model.joblib'))
+    try:
+        _, arrays, spec = compile_model(model, sample[FEATURES])
+        save_compiled(os.path.join(build_dir, 'model.npz'), arrays, spec)
+        model_file = 'model.npz'
+    except ValueError as e:
+        print(f"Model not compiled, partitions will be scored with joblib's model: {e}")
+        model_file = 'model.joblib'
+
+    manifest = {
+        "format": FORMAT,
+        "build": build,
+        "rows": rows,
+        "malformed": {"video_views": malformed},
+        "columns": kinds,
+        "partitions": partitions,
+        "model": model_file,
+    }
+    previous = read_manifest(out_dir) if os.path.exists(os.path.join(out_dir, MANIFEST)) else None
+    tmp = os.path.join(out_dir, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+    # The previous build stays on disk until the next one, since running services may still map it
+    keep = {build, previous['build'] if previous else None}
+    for name in os.listdir(out_dir):
+        if name not in keep and os.path.isdir(os.path.join(out_dir, name)):
+            shutil.rmtree(os.path.join(out_dir, name))
+    return manifest
+
+
+def read_manifest(store_dir):
+    with open(os.path.join(store_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f"Unsupported partition store format {manifest.get('format')!r} in {store_dir}")
+    return manifest
+
+
+class PartitionView(Mapping):
+    """One per-partition structure (the block, its regions, its range index) as a lazily loaded mapping"""
+
+    def __init__(self, store, part):
+        self.store = store
+        self.part = part
+
+    def __getitem__(self, key):
+        return self.store.load(key)[self.part]
+
+    def __iter__(self):
+        return iter(self.store.directories)
+
+    def __len__(self):
+        return len(self.store.directories)
+
+    def __contains__(self, key):
+        return key in self.store.directories
+
+
+class PartitionStore:
+    """Memory-mapped partitions, with at most `max_rows` rows of them (and what is built on them) resident.
+
+    A partition is loaded on first use, its per-partition structures are built, and the least
+    recently used partitions are dropped once the resident row count goes over the bound. Loads
+    run outside the store lock, so hits never wait behind them; concurrent loads of one partition
+    share a single read.
+    """
+
+    def __init__(self, store_dir, manifest, builders, max_rows):
+        root = os.path.join(store_dir, manifest['build'])
+        self.directories = {tuple(p['key']): os.path.join(root, p['dir']) for p in manifest['partitions']}
+        self.columns = manifest['columns']
+        self.builders = builders
+        self.max_rows = max_rows
+        self.resident = OrderedDict()
+        self.resident_rows = 0
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def view(self, part):
+        return PartitionView(self, part)
+
+    def read(self, key):
+        directory = self.directories[key]
+        columns = {}
+        for name, kind in self.columns.items():
+            if kind == 'numeric':
+                columns[name] = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+            else:
+                codes = np.load(os.path.join(directory, f'{name}.codes.npy'), mmap_mode='r')
+                values = np.load(os.path.join(directory, f'{name}.values.npy')).astype(object)
+                columns[name] = pd.Categorical.from_codes(codes, categories=values, validate=False)
+        return pd.DataFrame(columns, copy=False)
+
+    def resident_entry(self, key):
+        with self.lock:
+            entry = self.resident.get(key)
+            if entry is not None:
+                self.resident.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def load(self, key):
+        entry = self.resident_entry(key)
+        if entry is not None:
+            return entry
+        if key not in self.directories:
+            raise KeyError(key)
+        entry, _ = self.flights.run(key, partial(self.load_cold, key))
+        return entry
+
+    def load_cold(self, key):
+        # A load that finished just before this flight began has already made it resident
+        entry = self.resident_entry(key)
+        if entry is not None:
+            return entry
+        block = self.read(key)
+        entry = {"block": block}
+        for part, build in self.builders.items():
+            entry[part] = build(block)
+        with self.lock:
+            self.resident[key] = entry
+            self.resident_rows += len(block)
+            self.loads += 1
+            # Always keep the partition just loaded, even if it alone is over the bound
+            while self.resident_rows > self.max_rows and len(self.resident) > 1:
+                _, evicted = self.resident.popitem(last=False)
+                self.resident_rows -= len(evicted['block'])
+                self.evictions += 1
+        return entry
+
+    def stats(self):
+        with self.lock:
+            return {
+                "partitions": len(self.directories),
+                "resident_partitions": len(self.resident),
+                "resident_rows": self.resident_rows,
+                "max_rows": self.max_rows,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "loading": self.flights.stats()["in_flight"],
+            }
+
+
+class PartitionedCatalog:
+    """A Catalog whose partitions live on disk and are loaded per query.
+
+    It exposes the same partitions / regions / ranges lookups as the in-memory Catalog, backed by
+    the store, so request handling is unchanged. Whole-catalog structures are not built: there is
+    no `data` frame and no similar-creators index.
+    """
+
+    def __init__(self, store_dir, version, max_rows):
+        manifest = read_manifest(store_dir)
+        self.model = load_model(os.path.join(store_dir, manifest['build'], manifest['model']))
+        self.version = version
+        self.malformed = manifest.get('malformed') or {}
+        self.rows = manifest['rows']
+        self.data = None
+        self.similar = None
+        # Built with no partitions, then pointed at the store so each partition's regions are built on load
+        self.regions = build_regions(self.model, {}, FEATURES)
+        self.ranges = RangeIndex({})
+        builders = {"ranges": self.ranges.build}
+        if self.regions is not None:
+            builders["regions"] = self.regions.build
+        self.store = PartitionStore(store_dir, manifest, builders, max_rows)
+        self.partitions = self.store.view('block')
+        self.ranges.partitions = self.store.view('ranges')
+        if self.regions is not None:
+            self.regions.partitions = self.store.view('regions')
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+
+
+def load_partitioned(store_dir, max_rows, version):
+    return PartitionedCatalog(store_dir, version, max_rows)
+
+
+def store_manifest_path(store_dir):
+    return os.path.join(store_dir, MANIFEST)
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def benchmark(store_dir, max_rows, queries=2000, seed=0):
+    """Query every partition in random order through a bounded cache; reports latency and peak RSS"""
+    catalog = PartitionedCatalog(store_dir, 'bench', max_rows)
+    rng = np.random.default_rng(seed)
+    keys = list(catalog.store.directories)
+    picks = rng.integers(0, len(keys), queries)
+    timings = []
+    for pick in picks:
+        key = keys[pick]
+        start = time.perf_counter()
+        block = catalog.partitions[key]
+        candidates = block.assign(brand_budget_usd=float(rng.lognormal(9, 1.5)), min_views_required=0.0)
+        if catalog.regions is not None:
+            values = catalog.regions.predict(key, candidates['brand_budget_usd'].iloc[0], 0.0)
+        else:
+            values = catalog.model.predict(candidates[FEATURES])
+        candidates.assign(predicted_earning=values).sort_values(
+            by='predicted_earning', ascending=False, kind='mergesort').head(5)
+        timings.append(time.perf_counter() - start)
+    p50, p99 = np.percentile(timings, [50, 99]) * 1000
+    return {"rows": catalog.rows, "queries": queries, "p50_ms": p50, "p99_ms": p99,
+            "peak_rss_kb": peak_rss_kb(), **catalog.store.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or benchmark the on-disk partitioned catalog')
+    parser.add_argument('command', choices=['build', 'bench'])
+    parser.add_argument('--data', default='final.csv')
+    parser.add_argument('--model', default='creator_recommendation_model.joblib')
+    parser.add_argument('--out', default='final.partitions')
+    parser.add_argument('--chunk-rows', type=int, default=500_000)
+    parser.add_argument('--max-rows', type=int, default=2_000_000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        manifest = build_partitioned(args.data, args.model, args.out, args.chunk_rows)
+        print(f"Wrote {manifest['rows']} rows in {len(manifest['partitions'])} partitions "
+              f"to {args.out} (build {manifest['build']}), peak RSS {peak_rss_kb()} kB")
+    else:
+        print(json.dumps(benchmark(args.out, args.max_rows, args.queries), indent=2))
+
+
+if __name__ == '__main__':
+    main()
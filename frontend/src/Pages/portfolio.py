@@ -0,0 +1,121 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+# What a sponsorship is assumed to cost: one month of the creator's estimated earnings
+PRICE_COLUMNS = {
+    'low': ('lowest_monthly_earnings',),
+    'mid': ('lowest_monthly_earnings', 'highest_monthly_earnings'),
+    'high': ('highest_monthly_earnings',),
+}
+# Budget resolution of the DP; each cost is rounded up to a whole bucket so a solution never overspends.
+# Smaller pools get finer buckets, up to the cell budget.
+MIN_BUCKETS = 1000
+MAX_BUCKETS = 10_000
+# Candidates x buckets the DP may fill; past MIN_BUCKETS per candidate only greedy runs
+DP_MAX_CELLS = 5_000_000
+
+
+def prices(candidates, band='low'):
+    columns = PRICE_COLUMNS[band]
+    return candidates[list(columns)].to_numpy(dtype=np.float64).mean(axis=1)
+
+
+def solve_dp(values, weights, capacity):
+    """Exact 0/1 knapsack over integer weights; one vectorized update of the value table per item"""
+    best = np.zeros(capacity + 1)
+    take = np.zeros((len(values), capacity + 1), dtype=bool)
+    for i, (value, weight) in enumerate(zip(values, weights)):
+        # The right-hand side is evaluated before the write, so each item is used at most once
+        candidate = best[:capacity + 1 - weight] + value
+        better = candidate > best[weight:]
+        take[i, weight:] = better
+        best[weight:] = np.where(better, candidate, best[weight:])
+    chosen = []
+    remaining = capacity
+    for i in range(len(values) - 1, -1, -1):
+        if take[i, remaining]:
+            chosen.append(i)
+            remaining -= weights[i]
+    return np.array(chosen[::-1], dtype=np.intp)
+
+
+def solve_greedy(values, costs, budget):
+    """Best value-per-dollar first, then anything that still fits; never worse than half the optimum"""
+    order = np.argsort(-values / costs, kind='stable')
+    chosen = []
+    remaining = budget
+    while order.size:
+        fits = order[costs[order] <= remaining]
+        if not fits.size:
+            break
+        # Take the longest affordable prefix in ratio order, then retry the rest with what is left
+        spent = np.cumsum(costs[fits])
+        prefix = fits[spent <= remaining]
+        if not prefix.size:
+            prefix = fits[:1]
+        chosen.append(prefix)
+        remaining -= costs[prefix].sum()
+        order = fits[len(prefix):]
+    chosen = np.concatenate(chosen) if chosen else np.array([], dtype=np.intp)
+    single = np.argmax(np.where(costs <= budget, values, -np.inf))
+    if values[single] > values[chosen].sum():
+        chosen = np.array([single], dtype=np.intp)
+    return np.sort(chosen)
+
+
+def optimize(values, costs, budget, max_cells=DP_MAX_CELLS):
+    """Positions of the candidates that maximize total value at a total cost within `budget`.
+
+    Returns the chosen positions and the solver whose answer was kept: "all" when everything
+    fits, otherwise "dp" or "greedy". Greedy always runs since it is cheap, and it can beat the
+    DP when rounding costs up to buckets wastes budget; very large pools only run greedy.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    costs = np.asarray(costs, dtype=np.float64)
+    # Unpriced creators, ones worth nothing and ones over the whole budget can never help
+    usable = np.flatnonzero(np.isfinite(costs) & (costs > 0) & (values > 0) & (costs <= budget))
+    if not usable.size:
+        return usable, "all"
+    if costs[usable].sum() <= budget:
+        return usable, "all"
+    greedy = usable[solve_greedy(values[usable], costs[usable], budget)]
+    buckets = min(max_cells // len(usable), MAX_BUCKETS)
+    if buckets < MIN_BUCKETS:
+        return greedy, "greedy"
+    weights = np.ceil(costs[usable] / (budget / buckets)).astype(np.intp)
+    dp = usable[solve_dp(values[usable], weights, buckets)]
+    if values[greedy].sum() > values[dp].sum():
+        return greedy, "greedy"
+    return dp, "dp"
+
+
+def benchmark(sizes=(500, 2000, 5000, 20_000, 200_000), seed=0):
+    """Solve time and value of the DP and greedy solvers on random pools shaped like the catalog"""
+    rng = np.random.default_rng(seed)
+    results = []
+    for n in sizes:
+        costs = rng.lognormal(9.5, 1.5, n)
+        values = costs * rng.lognormal(1.5, 0.8, n)
+        budget = float(np.median(costs) * 25)
+        row = {"candidates": n}
+        for name, cells in (("optimize", DP_MAX_CELLS), ("greedy_only", 0)):
+            start = time.perf_counter()
+            chosen, solver = optimize(values, costs, budget, max_cells=cells)
+            row[name] = {"ms": (time.perf_counter() - start) * 1000, "value": values[chosen].sum(),
+                         "spent": costs[chosen].sum() / budget, "solver": solver}
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the portfolio solvers')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 2000, 5000, 20_000, 200_000])
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.sizes), indent=2))
+
+
+if __name__ == '__main__':
+    main()
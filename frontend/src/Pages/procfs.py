@@ -0,0 +1,54 @@
+import os
+
+
+def process_memory(pid):
+    """Resident, proportional, shared and private memory of a process in kB (Linux only)"""
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        return None
+    return {
+        "rss_kb": fields.get('Rss', 0),
+        "pss_kb": fields.get('Pss', 0),
+        "shared_kb": fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+        "private_kb": fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def child_pids(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def process_tree(pid):
+    """pid and all its descendants (Linux only)"""
+    pids = [pid]
+    for parent in pids:
+        pids.extend(child_pids(parent))
+    return pids
+
+
+def cpu_seconds(pids):
+    """User + system CPU time of these processes so far (Linux only)"""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            pass
+    return total / os.sysconf('SC_CLK_TCK')
+
+
+def worker_report(master_pid):
+    workers = [{"pid": pid, **(process_memory(pid) or {})} for pid in child_pids(master_pid)]
+    return {"master": {"pid": master_pid, **(process_memory(master_pid) or {})}, "workers": workers}
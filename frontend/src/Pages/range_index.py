@@ -0,0 +1,64 @@
+import math
+
+import numpy as np
+
+# Creator columns a brief can constrain with {"min": ..., "max": ...}
+RANGE_COLUMNS = ('subscribers', 'video_views', 'video_views_for_the_last_30_days')
+
+
+def parse_filters(content):
+    """The brief's range filters as a sorted tuple of (column, min, max); raises ValueError when malformed"""
+    filters = content.get('filters') or {}
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object")
+    parsed = []
+    for column, bounds in sorted(filters.items()):
+        if column not in RANGE_COLUMNS:
+            raise ValueError(f"Unsupported filter: {column}")
+        if not isinstance(bounds, dict):
+            raise ValueError(f"Filter {column} must be an object with min and/or max")
+        lo = float(bounds.get('min', -math.inf))
+        hi = float(bounds.get('max', math.inf))
+        if math.isnan(lo) or math.isnan(hi) or lo > hi:
+            raise ValueError(f"Filter {column} has an empty range")
+        if lo > -math.inf or hi < math.inf:
+            parsed.append((column, lo, hi))
+    return tuple(parsed)
+
+
+class RangeIndex:
+    """Each partition's range columns, sorted, with the block positions of the sorted values.
+
+    A filter is two binary searches that give the span of matching positions. The narrowest
+    span drives the query and the other filters are checked only on its rows, so a filtered
+    request costs the matches it keeps, not the size of the partition.
+    """
+
+    def __init__(self, partitions):
+        self.partitions = {key: self.build(block) for key, block in partitions.items()}
+
+    def build(self, block):
+        columns = {}
+        for column in RANGE_COLUMNS:
+            values = block[column].to_numpy(dtype=np.float64)
+            # NaNs sort last, past +inf, so no range ever reaches them
+            order = np.argsort(values, kind='stable')
+            columns[column] = (values[order], order, values)
+        return columns
+
+    def positions(self, key, filters):
+        """Ascending block positions of the creators inside every range"""
+        columns = self.partitions[key]
+        spans = []
+        for column, lo, hi in filters:
+            sorted_values, order, _ = columns[column]
+            start = np.searchsorted(sorted_values, lo, side='left')
+            stop = np.searchsorted(sorted_values, hi, side='right')
+            spans.append((stop - start, column, lo, hi, order[start:stop]))
+        spans.sort(key=lambda span: span[0])
+        positions = spans[0][4]
+        for _, column, lo, hi, _ in spans[1:]:
+            values = columns[column][2][positions]
+            positions = positions[(values >= lo) & (values <= hi)]
+        # Block order keeps ties ranked the same way as an unfiltered request
+        return np.sort(positions)
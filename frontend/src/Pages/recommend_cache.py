@@ -0,0 +1,95 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+def bucket(value, digits=2):
+    """Round a positive amount to a few significant digits so nearby requests share a key"""
+    value = float(value)
+    if value <= 0 or not math.isfinite(value):
+        return value
+    return round(value, digits - 1 - int(math.floor(math.log10(value))))
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, ttl_seconds=300, bucketing=False, bucket_digits=2):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.bucketing = bucketing
+        self.bucket_digits = bucket_digits
+        self.version = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def normalize(self, brand_budget_usd, country, product_category, min_views_required):
+        """Return the request parameters the cache key (and the computation) should use"""
+        brand_budget_usd = float(brand_budget_usd)
+        min_views_required = float(min_views_required)
+        if self.bucketing:
+            brand_budget_usd = bucket(brand_budget_usd, self.bucket_digits)
+            min_views_required = bucket(min_views_required, self.bucket_digits)
+        return brand_budget_usd, country.strip(), product_category.strip(), min_views_required
+
+    def key(self, brief, k, filters=()):
+        brand_budget_usd, country, product_category, min_views_required = brief
+        return (country.lower(), product_category.lower(), brand_budget_usd, min_views_required, k, filters)
+
+    def check_version(self, version):
+        # Called with the lock held; a new dataset or model drops everything cached for the old one
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.version = version
+
+    def get(self, key, version):
+        with self.lock:
+            self.check_version(version)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version):
+        with self.lock:
+            self.check_version(version)
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "bucketing": self.bucketing,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,306 @@
+import argparse
+import heapq
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+from flask import Flask, request, jsonify
+
+from catalog import NO_MATCH_MESSAGE
+from serialization import respond
+from serve import load_briefs, wait_ready
+from shards import SHARD_BY, shard_of
+
+# What each shard's /recommend returns, and so what the merge keeps
+TOP_K = 5
+
+
+class ShardUnavailable(Exception):
+    def __init__(self, shard, reason):
+        super().__init__(f"Shard {shard.index} ({shard.url}) is unavailable: {reason}")
+        self.shard = shard
+
+
+class ShardClient:
+    """One shard's address, its health as last checked and its recent call latencies"""
+
+    def __init__(self, index, count, by, url, timeout):
+        self.index = index
+        self.expected = f"{index}/{count} by {by}"
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=1024)
+        self.requests = 0
+        self.errors = 0
+        # None until the first health check
+        self.healthy = None
+        self.version = None
+        self.rows = None
+        self.checked_at = None
+        self.last_error = None
+
+    def record(self, seconds, error=None, down=False):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(seconds)
+            if error is not None:
+                self.errors += 1
+                self.last_error = error
+            if down:
+                self.healthy = False
+
+    def post(self, path, body):
+        """(status, body) of a call, errors included; ShardUnavailable when the shard cannot be reached.
+
+        Only a failed call marks the shard down. A 5xx answer may come from one bad request, so it
+        is passed on and the shard stays in service until a health check says otherwise.
+        """
+        start = time.perf_counter()
+        call = urllib.request.Request(self.url + path, data=json.dumps(body).encode(),
+                                      headers={'Content-Type': 'application/json'})
+        try:
+            try:
+                with urllib.request.urlopen(call, timeout=self.timeout) as response:
+                    status, payload = response.status, json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                status, payload = e.code, json.loads(e.read() or b'{}')
+        except (OSError, ValueError) as e:
+            self.record(time.perf_counter() - start, str(e), down=True)
+            raise ShardUnavailable(self, e)
+        error = payload.get('error', f"HTTP {status}") if status >= 500 else None
+        self.record(time.perf_counter() - start, error)
+        return status, payload
+
+    def check(self):
+        try:
+            with urllib.request.urlopen(self.url + '/recommend/version', timeout=self.timeout) as response:
+                status = json.loads(response.read())
+            error = None
+            if status.get('shard') != self.expected:
+                error = f"serves shard {status.get('shard')}, expected {self.expected}"
+        except (OSError, ValueError) as e:
+            status, error = {}, str(e)
+        with self.lock:
+            self.healthy = error is None
+            self.version = status.get('version')
+            self.rows = status.get('rows')
+            self.checked_at = datetime.now().isoformat(timespec='seconds')
+            if error is not None:
+                self.last_error = error
+
+    def stats(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (None, None, None)
+            return {
+                "shard": self.index,
+                "url": self.url,
+                "healthy": self.healthy,
+                "version": self.version,
+                "rows": self.rows,
+                "checked_at": self.checked_at,
+                "requests": self.requests,
+                "errors": self.errors,
+                "p50_ms": p50,
+                "p95_ms": p95,
+                "p99_ms": p99,
+                "last_error": self.last_error,
+            }
+
+
+def merge(lists, k=TOP_K):
+    """k-way merge of per-shard top-k lists into the top k an unsharded catalog would return.
+
+    Each list is already in (predicted_earning descending, catalog_row) order, which is how a
+    single catalog breaks ties; the shards' catalog_row is dropped from the result.
+    """
+    merged = heapq.merge(*lists, key=lambda creator: (-creator['predicted_earning'], creator['catalog_row']))
+    return [{name: value for name, value in creator.items() if name != 'catalog_row'}
+            for creator in islice(merged, k)]
+
+
+class Router:
+    """Scatter each /recommend to the shards that can hold its creators and gather one answer.
+
+    With shards owning whole countries a brief goes to exactly one shard. With creators hashed
+    across shards every shard holds part of each (country, channel_type), so a brief goes to all
+    of them and their top-k lists are merged.
+    """
+
+    def __init__(self, urls, by='country', timeout=5.0, health_interval=2.0):
+        if by not in SHARD_BY:
+            raise ValueError(f"Shard ownership must be one of {', '.join(SHARD_BY)}, not {by!r}")
+        self.by = by
+        self.shards = [ShardClient(i, len(urls), by, url, timeout) for i, url in enumerate(urls)]
+        self.health_interval = health_interval
+        self.pool = ThreadPoolExecutor(max_workers=8 * len(urls), thread_name_prefix='scatter')
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='shard-health', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            for shard in self.shards:
+                shard.check()
+            time.sleep(self.health_interval)
+
+    def targets(self, content):
+        if self.by == 'country':
+            country = content.get('country')
+            # A brief without a country still goes to one shard, which answers the 400
+            index = shard_of([country if isinstance(country, str) else ''], len(self.shards))[0]
+            return [self.shards[index]]
+        return self.shards
+
+    def recommend(self, content):
+        """(status, body, shards asked) for one brief"""
+        targets = self.targets(content)
+        down = [shard for shard in targets if shard.healthy is False]
+        if down:
+            # A shard known to be down would only make every brief wait for its timeout
+            raise ShardUnavailable(down[0], down[0].last_error)
+        answers = list(self.pool.map(lambda shard: shard.post('/recommend', content), targets))
+        for status, body in answers:
+            if status != 200:
+                return status, body, targets
+        bodies = [body for _, body in answers]
+        top = merge([body['top_creators'] for body in bodies])
+        version = ','.join(str(body.get('version')) for body in bodies)
+        if top:
+            return 200, {"top_creators": top, "version": version}, targets
+        # Shards without the (country, channel_type) say there is no such partition; ones with it know better
+        messages = [body.get('message') for body in bodies]
+        message = next((m for m in messages if m != NO_MATCH_MESSAGE), NO_MATCH_MESSAGE)
+        return 200, {"top_creators": [], "message": message, "version": version}, targets
+
+    def stats(self):
+        return {"by": self.by, "shards": [shard.stats() for shard in self.shards]}
+
+
+def create_app(router):
+    app = Flask(__name__)
+
+    @app.route('/recommend', methods=['POST'])
+    def recommend():
+        content = request.get_json(silent=True)
+        # Checked here rather than left to the shards, which would each answer it with a 500
+        if not isinstance(content, dict):
+            return jsonify({"error": "Request body must be a JSON object"}), 400
+        try:
+            status, body, targets = router.recommend(content)
+        except ShardUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        return respond(body, status, {"X-Shards": ','.join(str(shard.index) for shard in targets)})
+
+    @app.route('/router/shards', methods=['GET'])
+    def router_shards():
+        return jsonify(router.stats()), 200
+
+    return app
+
+
+def serve_router(urls, by, host, port, timeout, health_interval):
+    from werkzeug.serving import make_server
+
+    router = Router(urls, by, timeout, health_interval)
+    router.start()
+    server = make_server(host, port, create_app(router), threaded=True)
+    print(f"Routing on {host}:{port} to {len(urls)} shards by {by}", flush=True)
+    server.serve_forever()
+
+
+def launch_shards(count, by, base_port, workers):
+    """Start each shard as its own serve.py, locally; returns the processes and their URLs"""
+    serve = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')
+    processes, urls = [], []
+    for index in range(count):
+        env = dict(os.environ, RECOMMEND_SHARD=f'{index}/{count}', RECOMMEND_SHARD_BY=by)
+        port = base_port + index
+        processes.append(subprocess.Popen(
+            [sys.executable, serve, '--workers', str(workers), '--port', str(port), '--report-interval', '0'], env=env))
+        urls.append(f'http://127.0.0.1:{port}')
+    for url in urls:
+        wait_ready(url + '/recommend/version')
+    return processes, urls
+
+
+def verify(router_url, data_path, count=200, seed=0):
+    """Compare the router's answers with an unsharded catalog loaded in this process"""
+    os.environ.pop('RECOMMEND_SHARD', None)
+    os.environ['RECOMMEND_HOT_RELOAD'] = '0'
+    import app
+
+    client = app.app.test_client()
+    rng = random.Random(seed)
+    mismatches = []
+    for brief in load_briefs(data_path, count, seed):
+        if rng.random() < 0.5:
+            brief['filters'] = {"subscribers": {"min": rng.choice([1e7, 2e7, 5e7])}}
+        expected = client.post('/recommend', json=brief).get_json()
+        call = urllib.request.Request(router_url + '/recommend', data=json.dumps(brief).encode(),
+                                      headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(call) as response:
+            actual = json.loads(response.read())
+        if actual.get('top_creators') != expected.get('top_creators') or actual.get('message') != expected.get('message'):
+            mismatches.append({"brief": brief, "expected": expected, "actual": actual})
+    return {"briefs": count, "mismatches": len(mismatches), "first_mismatch": mismatches[0] if mismatches else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scatter/gather router over sharded recommenders')
+    parser.add_argument('command', choices=['serve', 'local', 'verify'])
+    parser.add_argument('--shard-urls', nargs='+', default=[])
+    parser.add_argument('--shards', type=int, default=3, help='shard processes to start for `local`')
+    parser.add_argument('--by', choices=SHARD_BY, default=os.environ.get('RECOMMEND_SHARD_BY', 'country'))
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5100)
+    parser.add_argument('--base-port', type=int, default=5101)
+    parser.add_argument('--workers', type=int, default=1, help='pre-fork workers per shard for `local`')
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--health-interval', type=float, default=2.0)
+    parser.add_argument('--router', default='http://127.0.0.1:5100')
+    parser.add_argument('--data', default='final.csv')
+    parser.add_argument('--briefs', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == 'verify':
+        print(json.dumps(verify(args.router, args.data, args.briefs), indent=2))
+    elif args.command == 'serve':
+        if not args.shard_urls:
+            parser.error('serve needs --shard-urls, one per shard in shard order')
+        serve_router(args.shard_urls, args.by, args.host, args.port, args.timeout, args.health_interval)
+    else:
+        processes, urls = launch_shards(args.shards, args.by, args.base_port, args.workers)
+        # Stopping the router stops its shards too
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            serve_router(urls, args.by, args.host, args.port, args.timeout, args.health_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for process in processes:
+                process.send_signal(signal.SIGTERM)
+            for process in processes:
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import gzip
+import json
+import time
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: MessagePack is only offered when installed
+    msgpack = None
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+# Below this size gzip costs more CPU than it saves on the wire
+GZIP_MIN_BYTES = 1400
+GZIP_LEVEL = 5
+
+
+def records(frame, columns):
+    """Rows of `frame` as dicts, converting each column to Python scalars in one NumPy call"""
+    values = [frame[column].to_numpy().tolist() for column in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def encode_json(body):
+    if orjson is not None:
+        # Sorted keys keep the output byte-identical in shape to Flask's jsonify
+        return orjson.dumps(body, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(body, sort_keys=True, separators=(',', ':')).encode()
+
+
+def encode(body, accept):
+    if msgpack is not None and any(kind in accept for kind in MSGPACK_TYPES):
+        return msgpack.packb(body, use_bin_type=True), 'application/msgpack'
+    return encode_json(body), 'application/json'
+
+
+def respond(body, status=200, headers=None):
+    """Encode `body` for the client's Accept / Accept-Encoding headers"""
+    payload, mimetype = encode(body, request.headers.get('Accept', ''))
+    response = Response(payload, status=status, mimetype=mimetype, headers=headers)
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    if len(payload) >= GZIP_MIN_BYTES and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.set_data(gzip.compress(payload, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def benchmark(data_path, sizes=(5, 50, 500), batch=50, repeat=200):
+    """Bytes and microseconds per response for the to_dict + json path and each fast encoding"""
+    from catalog import read_dataset
+
+    data, _ = read_dataset(data_path)
+    data['predicted_earning'] = data['earning_of_brand_through_deal_usd'].fillna(0.0)
+    columns = ['youtuber', 'predicted_earning', 'subscribers', 'video_views', 'country', 'channel_type']
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            out = fn()
+        return (time.perf_counter() - start) / repeat * 1e6, out
+
+    results = []
+    cases = [(f"top{k}", k, 1) for k in sizes] + [(f"batch{batch}x5", 5, batch)]
+    for name, k, briefs in cases:
+        top = data.head(k)
+
+        def baseline():
+            body = {"results": [{"top_creators": top[columns].to_dict(orient='records')} for _ in range(briefs)]}
+            return json.dumps(body, sort_keys=True).encode()
+
+        def fast(encoder):
+            def run():
+                body = {"results": [{"top_creators": records(top, columns)} for _ in range(briefs)]}
+                return encoder(body)
+            return run
+
+        row = {"case": name}
+        encoders = [("to_dict_json", baseline), ("records_json", fast(encode_json))]
+        if msgpack is not None:
+            encoders.append(("records_msgpack", fast(lambda body: msgpack.packb(body, use_bin_type=True))))
+        encoders.append(("records_json_gzip", fast(lambda body: gzip.compress(encode_json(body), GZIP_LEVEL))))
+        for label, fn in encoders:
+            us, payload = timed(fn)
+            row[label] = {"us": us, "bytes": len(payload)}
+        results.append(row)
+    return {"orjson": orjson is not None, "msgpack": msgpack is not None, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /recommend response encodings')
+    parser.add_argument('--data', default='final.csv')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.data, repeat=args.repeat), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+import argparse
+import gc
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from multiprocessing import Pool
+
+from procfs import worker_report
+
+
+class PreforkServer:
+    """Load the catalog once, then fork workers that share its pages copy-on-write.
+
+    Workers exit after max_requests (plus jitter) and are replaced; a dataset change seen by
+    the master triggers a rolling restart, so new workers fork from the freshly loaded catalog.
+    """
+
+    def __init__(self, app_module, host, port, workers, max_requests=0, max_requests_jitter=0,
+                 reload_interval=5.0, report_interval=60.0):
+        self.app_module = app_module
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.reload_interval = reload_interval
+        self.report_interval = report_interval
+        self.children = {}
+        self.recycled = 0
+        self.running = True
+        self.restart_requested = False
+
+    def listen(self):
+        self.socket = socket.create_server((self.host, self.port), backlog=2048)
+        self.socket.set_inheritable(True)
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.run_worker()
+            finally:
+                os._exit(0)
+        self.children[pid] = time.time()
+        return pid
+
+    def run_worker(self):
+        from werkzeug.serving import make_server
+
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        self.app_module.after_fork()
+        # Forked workers inherit the master's RNG state; reseed so their recycle points differ
+        random.seed()
+        limit = self.max_requests + random.randint(0, self.max_requests_jitter) if self.max_requests else 0
+        handled = [0]
+        app = self.app_module.app
+
+        def counted(environ, start_response):
+            handled[0] += 1
+            return app(environ, start_response)
+
+        server = make_server(self.host, self.port, counted, fd=self.socket.fileno())
+        # Wake up regularly so a TERM is noticed between requests, never in the middle of one
+        server.timeout = 0.5
+        while not stopping and (not limit or handled[0] < limit):
+            server.handle_request()
+
+    def stop_workers(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self.children.pop(pid, None) is not None and self.running:
+                self.recycled += 1
+
+    def rolling_restart(self):
+        # Start each replacement before stopping the worker it replaces, so capacity never drops
+        for pid in list(self.children):
+            self.spawn()
+            self.stop_workers([pid])
+
+    def wait_for_leaderboards(self, timeout=300):
+        # Workers inherit the tables built before they fork and afterwards only rebuild for delta-log updates
+        version = self.app_module.reloader.current.version
+        if self.app_module.leaderboards.thread is not None and not self.app_module.leaderboards.wait(version, timeout):
+            print(f"Leaderboards for {version} not ready after {timeout}s, forking without them", flush=True)
+
+    def report(self):
+        print(json.dumps({"recycled": self.recycled, **worker_report(os.getpid())}), flush=True)
+
+    def run(self):
+        self.listen()
+        self.wait_for_leaderboards()
+        # Move everything loaded so far out of the collector's reach, so GC passes in the
+        # workers do not write to (and un-share) the catalog's pages
+        gc.collect()
+        gc.freeze()
+        os.environ['RECOMMEND_PREFORK_MASTER'] = str(os.getpid())
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'running', False))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, 'running', False))
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, 'restart_requested', True))
+        for _ in range(self.workers):
+            self.spawn()
+        print(f"Serving on {self.host}:{self.port} with {self.workers} workers "
+              f"(catalog {self.app_module.reloader.current.version})", flush=True)
+
+        next_reload = time.monotonic() + self.reload_interval
+        deltas = self.app_module.deltas
+        next_delta = time.monotonic() + (deltas.interval if deltas is not None else 0)
+        next_report = time.monotonic() + self.report_interval
+        while self.running:
+            time.sleep(0.2)
+            self.reap()
+            while len(self.children) < self.workers and self.running:
+                self.spawn()
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+            now = time.monotonic()
+            if self.reload_interval and now >= next_reload:
+                next_reload = now + self.reload_interval
+                if self.app_module.reloader.poll():
+                    self.wait_for_leaderboards()
+                    gc.collect()
+                    gc.freeze()
+                    print(f"Catalog {self.app_module.reloader.current.version} loaded, restarting workers", flush=True)
+                    self.rolling_restart()
+            if deltas is not None and now >= next_delta:
+                # Workers tail the log themselves; the master keeps up so new workers fork current,
+                # and compacts, which the reload poll above then rolls out
+                next_delta = now + deltas.interval
+                deltas.poll()
+                deltas.maybe_compact()
+            if self.report_interval and now >= next_report:
+                next_report = now + self.report_interval
+                self.report()
+
+        self.stop_workers(list(self.children))
+        deadline = time.monotonic() + 30
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        self.socket.close()
+
+
+def post_json(url, body, timeout=30):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def hammer(args):
+    url, briefs, duration, seed = args
+    rng = random.Random(seed)
+    done = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        post_json(url, rng.choice(briefs))
+        done += 1
+    return done
+
+
+def load_briefs(data_path, count=200, seed=0):
+    import pandas as pd
+    data = pd.read_csv(data_path).dropna(subset=['country', 'channel_type'])
+    rows = data.sample(n=count, replace=True, random_state=seed)
+    return [
+        {"brand_budget_usd": float(row.brand_budget_usd), "country": row.country,
+         "product_category": row.channel_type, "min_views_required": int(row.min_views_required)}
+        for row in rows.itertuples()
+    ]
+
+
+def wait_ready(url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not come up")
+
+
+def scaling_benchmark(worker_counts, clients, duration, port, data_path):
+    """Throughput and memory of the pre-fork server at each worker count, with the response cache off"""
+    briefs = load_briefs(data_path)
+    env = dict(os.environ, RECOMMEND_CACHE_SIZE='0')
+    results = []
+    for workers in worker_counts:
+        server = subprocess.Popen(
+            [sys.executable, __file__, '--workers', str(workers), '--port', str(port), '--report-interval', '0'],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            base = f'http://127.0.0.1:{port}'
+            wait_ready(base + '/recommend/version')
+            with Pool(clients) as pool:
+                counts = pool.map(hammer, [(base + '/recommend', briefs, duration, seed) for seed in range(clients)])
+            memory = json.loads(urllib.request.urlopen(base + '/recommend/workers').read())
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+        results.append({
+            "workers": workers,
+            "rps": sum(counts) / duration,
+            "worker_rss_kb": sum(w.get('rss_kb', 0) for w in memory['workers']),
+            "worker_pss_kb": sum(w.get('pss_kb', 0) for w in memory['workers']),
+            "master_rss_kb": memory['master'].get('rss_kb'),
+        })
+    base_rps = results[0]['rps'] / results[0]['workers']
+    for result in results:
+        result['scaling_efficiency'] = result['rps'] / (base_rps * result['workers']) if base_rps else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-fork production server for the recommender')
+    parser.add_argument('command', nargs='?', choices=['serve', 'bench'], default='serve')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--workers', type=int, nargs='+', default=[os.cpu_count() or 1])
+    parser.add_argument('--max-requests', type=int, default=10000)
+    parser.add_argument('--max-requests-jitter', type=int, default=1000)
+    parser.add_argument('--reload-interval', type=float, default=float(os.environ.get('RECOMMEND_RELOAD_INTERVAL', 5)))
+    parser.add_argument('--report-interval', type=float, default=60)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--data', default='final.csv')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        print(json.dumps(scaling_benchmark(args.workers, args.clients, args.duration, args.port, args.data), indent=2))
+        return
+
+    # The master polls for new data itself and recycles workers, so the per-process reload thread stays off
+    os.environ.setdefault('RECOMMEND_HOT_RELOAD', '0')
+    import app
+    PreforkServer(app, args.host, args.port, args.workers[0], args.max_requests, args.max_requests_jitter,
+                  args.reload_interval, args.report_interval).run()
+
+
+if __name__ == '__main__':
+    main()
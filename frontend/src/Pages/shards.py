@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+# Who owns a creator: every creator of a country on one shard, or creators hashed by name across all
+SHARD_BY = ('country', 'creator')
+
+
+def shard_of(values, count):
+    """Shard index of each value; the hash is fixed across processes and runs, unlike hash()"""
+    keys = pd.Series(values, dtype=object).fillna('').astype(str).str.strip().str.lower()
+    return (pd.util.hash_array(keys.to_numpy(dtype=object)) % np.uint64(count)).astype(np.intp)
+
+
+class Shard:
+    """One of `count` disjoint slices of the catalog, as served by one app.py behind router.py"""
+
+    def __init__(self, index, count, by='country'):
+        if by not in SHARD_BY:
+            raise ValueError(f"Shard ownership must be one of {', '.join(SHARD_BY)}, not {by!r}")
+        if not 0 <= index < count:
+            raise ValueError(f"Shard {index} is out of range for {count} shards")
+        self.index = index
+        self.count = count
+        self.by = by
+
+    def __str__(self):
+        return f"{self.index}/{self.count} by {self.by}"
+
+    def select(self, data):
+        """This shard's rows, with their position in the full catalog as `catalog_row`.
+
+        The router merges shards on (predicted_earning, catalog_row), which is the order an
+        unsharded catalog ranks ties in.
+        """
+        column = data['country'] if self.by == 'country' else data['youtuber']
+        mask = shard_of(column, self.count) == self.index
+        return data[mask].assign(catalog_row=np.flatnonzero(mask))
+
+
+def parse_shard(spec, by='country'):
+    """"2/4" is the third of four shards"""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard must look like INDEX/COUNT, not {spec!r}")
+    return Shard(index, count, by)
@@ -0,0 +1,287 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from coalesce import SingleFlight
+
+NUMERIC = [
+    'subscribers', 'video_views', 'video_views_for_the_last_30_days',
+    'lowest_monthly_earnings', 'highest_monthly_earnings',
+    'lowest_yearly_earnings', 'highest_yearly_earnings',
+]
+CATEGORICAL = ['country', 'channel_type']
+# Below this many creators a brute-force scan is already sub-millisecond and exact
+EXACT_BELOW = 20_000
+
+
+def creator_features(data):
+    """Log-scaled, standardized audience and earnings figures, and integer codes for country and category"""
+    numeric = np.log1p(np.clip(data[NUMERIC].to_numpy(dtype=np.float64), 0, None))
+    mean = np.nanmean(numeric, axis=0)
+    std = np.nanstd(numeric, axis=0)
+    numeric = np.nan_to_num((numeric - mean) / np.where(std > 0, std, 1.0)).astype(np.float32)
+    codes, sizes = [], []
+    for column in CATEGORICAL:
+        # A missing value is its own category, so every creator has exactly one slot set per column
+        column_codes, uniques = pd.factorize(data[column].astype(object).fillna('').astype(str).str.lower())
+        codes.append(column_codes)
+        sizes.append(len(uniques))
+    return np.ascontiguousarray(numeric), np.stack(codes, axis=1).astype(np.int32), sizes
+
+
+def name_rows(data):
+    """Row of each case-folded channel name; the first occurrence wins for duplicated names"""
+    names = data['youtuber'].astype(str).str.lower().to_numpy()
+    return dict(zip(names[::-1], np.arange(len(names))[::-1]))
+
+
+def one_hot(numeric, codes, sizes):
+    """Full vectors: the numeric block followed by one one-hot block per categorical column"""
+    parts = [numeric]
+    for column, size in enumerate(sizes):
+        block = np.zeros((len(codes), size), dtype=np.float32)
+        block[np.arange(len(codes)), codes[:, column]] = 1.0
+        parts.append(block)
+    return np.hstack(parts)
+
+
+def nearest_centroid(X, centroids, chunk=65536):
+    norms = (centroids ** 2).sum(axis=1)
+    out = np.empty(len(X), dtype=np.intp)
+    for start in range(0, len(X), chunk):
+        block = X[start:start + chunk]
+        out[start:start + chunk] = np.argmin(norms - 2.0 * block @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(X, k, iterations=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(len(X), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = nearest_centroid(X, centroids)
+        counts = np.bincount(assign, minlength=k)
+        order = np.argsort(assign, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        sums = np.add.reduceat(X[order], starts[filled], axis=0)
+        # Empty lists keep their previous centroid
+        centroids[filled] = sums / counts[filled, None]
+    return centroids
+
+
+class SimilarityIndex:
+    """k-nearest-neighbour search over creator vectors.
+
+    A creator's vector is its standardized numeric features plus one-hot country and category.
+    Only the numeric block and the category codes are stored: two one-hot blocks differ by
+    exactly 2 in squared distance when the codes differ, so distances come out identical while a
+    scan reads a fraction of the memory.
+
+    Small catalogs are scanned exactly. Larger ones use an inverted-file index: k-means splits
+    the vectors into lists, and a query only scans the lists of its `nprobe` nearest centroids.
+    """
+
+    def __init__(self, data, nprobe=4, exact_below=EXACT_BELOW, seed=0):
+        self.numeric, self.codes, self.sizes = creator_features(data)
+        self.norms = (self.numeric ** 2).sum(axis=1)
+        self.rows_by_name = name_rows(data)
+        self.nprobe = nprobe
+        self.centroids = None
+        if len(self.numeric) >= exact_below:
+            self.build_lists(seed)
+
+    def __len__(self):
+        return len(self.numeric)
+
+    def build_lists(self, seed, chunk=65536):
+        n = len(self)
+        nlist = int(np.clip(2 * np.sqrt(n), 16, 4096))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, min(n, 32 * nlist), replace=False))
+        self.centroids = kmeans(one_hot(self.numeric[sample], self.codes[sample], self.sizes), nlist, seed=seed)
+        self.centroid_norms = (self.centroids ** 2).sum(axis=1)
+        self.centroid_numeric = np.ascontiguousarray(self.centroids[:, :len(NUMERIC)])
+        # Column of each category's one-hot slot, so a query's centroid dot product needs no one-hot vector
+        self.slot_offsets = len(NUMERIC) + np.concatenate([[0], np.cumsum(self.sizes)[:-1]])
+        assign = np.concatenate([
+            nearest_centroid(one_hot(self.numeric[i:i + chunk], self.codes[i:i + chunk], self.sizes), self.centroids)
+            for i in range(0, n, chunk)
+        ])
+        # Store each list's rows contiguously so a probe is one slice
+        self.order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=nlist)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.list_numeric = self.numeric[self.order]
+        self.list_codes = [np.ascontiguousarray(self.codes[self.order, column]) for column in range(len(self.sizes))]
+        self.list_norms = self.norms[self.order]
+
+    def scores(self, numeric, codes, norms, row):
+        # Squared distance to `row`, less that row's constant squared norm
+        scores = norms - 2.0 * (numeric @ self.numeric[row])
+        for column, column_codes in enumerate(codes):
+            scores += 2.0 * (column_codes != self.codes[row, column])
+        return scores
+
+    def centroid_distances(self, row):
+        dots = self.centroid_numeric @ self.numeric[row]
+        for offset, code in zip(self.slot_offsets, self.codes[row]):
+            dots += self.centroids[:, offset + code]
+        return self.centroid_norms - 2.0 * dots
+
+    def scan(self, row):
+        """Candidate rows and their scores against `row`"""
+        if self.centroids is None:
+            return np.arange(len(self)), self.scores(self.numeric, self.codes.T, self.norms, row)
+        distances = self.centroid_distances(row)
+        probes = np.argpartition(distances, min(self.nprobe, len(distances) - 1))[:self.nprobe]
+        positions = np.concatenate([np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes])
+        # The compact numeric block and codes are cheap to gather, so score all probed lists in one pass
+        codes = [column_codes[positions] for column_codes in self.list_codes]
+        scores = self.scores(self.list_numeric[positions], codes, self.list_norms[positions], row)
+        return self.order[positions], scores
+
+    def search(self, row, k):
+        """The k creators nearest to `row` (excluding it) and their Euclidean distances, nearest first"""
+        rows, scores = self.scan(row)
+        scores[rows == row] = np.inf
+        k = min(k, len(rows) - 1)
+        if k <= 0:
+            return np.array([], dtype=np.intp), np.array([])
+        top = np.argpartition(scores, k - 1)[:k]
+        top = top[np.argsort(scores[top], kind='stable')]
+        return rows[top], np.sqrt(np.maximum(scores[top] + self.norms[row], 0.0))
+
+    def similar(self, name, k):
+        """Creators most like the named one, or None when the name is not in the catalog"""
+        row = self.rows_by_name.get(str(name).strip().lower())
+        if row is None:
+            return None
+        return self.search(row, k)
+
+
+class LazyIndex:
+    """A SimilarityIndex built on the first lookup rather than with the catalog.
+
+    The k-means lists take tens of seconds on a million creators, which every load, reload,
+    compaction and shard would otherwise pay before serving, mostly in processes that never
+    get a /similar request. Concurrent first lookups share one build.
+    """
+
+    def __init__(self, data, **options):
+        self.data = data
+        self.options = options
+        self.built = None
+        self.names = None
+        self.flights = SingleFlight()
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def rows_by_name(self):
+        # Name lookups (the delta log's) only need this map, not the vectors
+        if self.built is not None:
+            return self.built.rows_by_name
+        if self.names is None:
+            self.names = name_rows(self.data)
+        return self.names
+
+    def load(self):
+        if self.built is None:
+            self.flights.run('index', self.build)
+        return self.built
+
+    def build(self):
+        if self.built is None:
+            self.built = SimilarityIndex(self.data, **self.options)
+            self.names = None
+        return self.built
+
+    def after_fork(self):
+        # A build the parent had in flight never finishes here; the next lookup starts its own
+        self.flights = SingleFlight()
+
+    def search(self, row, k):
+        return self.load().search(row, k)
+
+    def similar(self, name, k):
+        return self.load().similar(name, k)
+
+    def stats(self):
+        return {"built": self.built is not None, "rows": len(self)}
+
+
+class ExcludingIndex:
+    """A SimilarityIndex with some of its rows taken out of every lookup.
+
+    Used for creators a delta log deleted or changed since the index was built: their vectors
+    (and the base rows a response would show) are stale, so they are neither found nor returned.
+    """
+
+    def __init__(self, index, excluded):
+        self.index = index
+        self.excluded = np.unique(np.asarray(excluded, dtype=np.intp))
+
+    @property
+    def rows_by_name(self):
+        return self.index.rows_by_name
+
+    def __len__(self):
+        return len(self.index) - len(self.excluded)
+
+    def similar(self, name, k):
+        row = self.rows_by_name.get(str(name).strip().lower())
+        if row is None or np.isin(row, self.excluded):
+            return None
+        rows, distances = self.index.search(row, k + len(self.excluded))
+        keep = ~np.isin(rows, self.excluded)
+        return rows[keep][:k], distances[keep][:k]
+
+
+def benchmark(data_path, rows, queries=200, k=10, seed=0):
+    """Query latency and recall@k of the IVF index against an exact scan on a synthetic catalog"""
+    from catalog import read_dataset
+
+    data, _ = read_dataset(data_path)
+    rng = np.random.default_rng(seed)
+    expanded = data.iloc[rng.integers(0, len(data), rows)].reset_index(drop=True)
+    noise = rng.lognormal(0.0, 0.35, size=(rows, 1))
+    expanded[NUMERIC] = expanded[NUMERIC].to_numpy() * noise
+    expanded['youtuber'] = expanded['youtuber'].astype(str) + '_' + pd.Series(np.arange(rows)).astype(str)
+
+    start = time.perf_counter()
+    index = SimilarityIndex(expanded, exact_below=0)
+    build_s = time.perf_counter() - start
+    picks = rng.choice(rows, queries, replace=False)
+    hits, elapsed = 0, 0.0
+    for row in picks:
+        start = time.perf_counter()
+        found, _ = index.search(row, k)
+        elapsed += time.perf_counter() - start
+        exact = index.scores(index.numeric, index.codes.T, index.norms, row)
+        exact[row] = np.inf
+        truth = np.argpartition(exact, k - 1)[:k]
+        hits += len(np.intersect1d(found, truth))
+    return {
+        "rows": rows,
+        "lists": len(index.centroids),
+        "nprobe": index.nprobe,
+        "build_s": build_s,
+        "query_us": elapsed / queries * 1e6,
+        f"recall_at_{k}": hits / (queries * k),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the similar-creators index')
+    parser.add_argument('--data', default='final.csv')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    args = parser.parse_args()
+    print(json.dumps([benchmark(args.data, rows) for rows in args.rows], indent=2))
+
+
+if __name__ == '__main__':
+    main()
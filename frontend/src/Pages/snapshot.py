@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import time
+import uuid
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from catalog import FEATURES, Catalog, load_catalog, read_dataset
+from earnings_regions import DEFAULT_MAX_BYTES
+from compiled_model import compile_model, load_compiled, save_compiled
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+
+def write_array(out_dir, name, array):
+    np.save(os.path.join(out_dir, name), np.ascontiguousarray(array), allow_pickle=False)
+
+
+def build_snapshot(data_path, model_path, out_dir):
+    """Write the parsed dataset and the model as memory-mappable files under out_dir"""
+    data, malformed = read_dataset(data_path)
+    return write_snapshot(data, malformed, joblib.load(model_path), out_dir)
+
+
+def write_snapshot(data, malformed, model, out_dir, delta_offset=0):
+    """Write a parsed frame and model as a new snapshot build.
+
+    `delta_offset` is how much of the delta log is already folded into `data`; services
+    loading this snapshot replay the log from there.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    # Every build gets its own file names and the manifest is replaced last, so a
+    # service reading the previous build never sees a mix of old and new columns
+    build = uuid.uuid4().hex[:8]
+    columns = []
+    for name in data.columns:
+        series = data[name]
+        if pd.api.types.is_numeric_dtype(series):
+            file = f'{name}.{build}.npy'
+            write_array(out_dir, file, series.to_numpy())
+            columns.append({"name": name, "kind": "numeric", "file": file})
+        else:
+            # Strings are dictionary-encoded: int32 codes (-1 for missing) plus a fixed-width value table
+            codes, values = pd.factorize(series, use_na_sentinel=True)
+            codes_file = f'{name}.codes.{build}.npy'
+            values_file = f'{name}.values.{build}.npy'
+            write_array(out_dir, codes_file, codes.astype(np.int32))
+            write_array(out_dir, values_file, np.asarray(values, dtype=str))
+            columns.append({"name": name, "kind": "string", "codes": codes_file, "values": values_file})
+
+    model_file = f'model.{build}.joblib'
+    # Uncompressed so the tree arrays can be memory-mapped on load
+    joblib.dump(model, os.path.join(out_dir, model_file))
+    try:
+        _, arrays, spec = compile_model(model, data[FEATURES])
+        compiled_file = f'model.{build}.npz'
+        save_compiled(os.path.join(out_dir, compiled_file), arrays, spec)
+    except ValueError as e:
+        print(f"Model not compiled, the snapshot will load it with joblib: {e}")
+        compiled_file = None
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "build": build,
+        "rows": len(data),
+        "malformed": malformed,
+        "columns": columns,
+        "model": model_file,
+        "compiled": compiled_file,
+        "delta_offset": delta_offset,
+    }
+    previous = read_manifest(out_dir) if os.path.exists(os.path.join(out_dir, MANIFEST)) else None
+    tmp = os.path.join(out_dir, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+    remove_stale_files(out_dir, [manifest, previous])
+    return manifest
+
+
+def manifest_files(manifest):
+    files = {manifest['model'], manifest.get('compiled')}
+    for column in manifest['columns']:
+        files.update(column[key] for key in ('file', 'codes', 'values') if key in column)
+    return files
+
+
+def remove_stale_files(out_dir, keep):
+    # The previous build stays on disk until the next one, since running services may still map it
+    referenced = set()
+    for manifest in keep:
+        if manifest is not None:
+            referenced |= manifest_files(manifest)
+    for name in os.listdir(out_dir):
+        if name != MANIFEST and name not in referenced and name.endswith(('.npy', '.npz', '.joblib')):
+            os.remove(os.path.join(out_dir, name))
+
+
+def read_manifest(snapshot_dir):
+    with open(os.path.join(snapshot_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')!r} in {snapshot_dir}")
+    return manifest
+
+
+def read_snapshot(snapshot_dir, mmap=True):
+    manifest = read_manifest(snapshot_dir)
+    mode = 'r' if mmap else None
+    columns = {}
+    for column in manifest['columns']:
+        if column['kind'] == 'numeric':
+            columns[column['name']] = np.load(os.path.join(snapshot_dir, column['file']), mmap_mode=mode)
+        else:
+            codes = np.load(os.path.join(snapshot_dir, column['codes']), mmap_mode=mode)
+            values = np.load(os.path.join(snapshot_dir, column['values'])).astype(object)
+            columns[column['name']] = pd.Categorical.from_codes(codes, categories=values, validate=False)
+    # copy=False keeps the numeric columns backed by the mapped pages shared between workers
+    data = pd.DataFrame(columns, copy=False)
+    if manifest.get('compiled'):
+        model = load_compiled(os.path.join(snapshot_dir, manifest['compiled']))
+    else:
+        model = joblib.load(os.path.join(snapshot_dir, manifest['model']), mmap_mode=mode)
+    return data, model
+
+
+def load_snapshot(snapshot_dir, version, shard=None, regions_max_bytes=DEFAULT_MAX_BYTES):
+    data, model = read_snapshot(snapshot_dir)
+    if shard is not None:
+        data = shard.select(data)
+    manifest = read_manifest(snapshot_dir)
+    catalog = Catalog(data, model, version, manifest.get('malformed'), regions_max_bytes)
+    catalog.delta_offset = manifest.get('delta_offset', 0)
+    return catalog
+
+
+def snapshot_manifest_path(snapshot_dir):
+    return os.path.join(snapshot_dir, MANIFEST)
+
+
+def time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings)
+
+
+def benchmark(data_path, model_path, snapshot_dir, repeat=5):
+    """Compare CSV + joblib cold start against the snapshot path, including the partition index"""
+    csv_best, csv_mean = time_call(lambda: load_catalog(data_path, model_path, 'csv'), repeat)
+    snap_best, snap_mean = time_call(lambda: load_snapshot(snapshot_dir, 'snapshot'), repeat)
+    return {
+        "rows": read_manifest(snapshot_dir)['rows'],
+        "csv_ms": {"best": csv_best * 1000, "mean": csv_mean * 1000},
+        "snapshot_ms": {"best": snap_best * 1000, "mean": snap_mean * 1000},
+        "speedup": csv_mean / snap_mean if snap_mean else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or benchmark the recommender snapshot')
+    parser.add_argument('command', choices=['build', 'bench'])
+    parser.add_argument('--data', default='final.csv')
+    parser.add_argument('--model', default='creator_recommendation_model.joblib')
+    parser.add_argument('--out', default='final.snapshot')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        manifest = build_snapshot(args.data, args.model, args.out)
+        print(f"Wrote {manifest['rows']} rows to {args.out} (build {manifest['build']})")
+    else:
+        print(json.dumps(benchmark(args.data, args.model, args.out, args.repeat), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Every fast path must answer exactly what model.predict and a stable sort over the catalog would.
+
+Run from this directory with `python -m pytest -q test_consistency.py`.
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from catalog import FEATURES, Catalog, load_catalog, load_model, read_dataset
+from compiled_model import CompiledTree, export_model
+from delta_log import apply_entries, compacted_data
+from leaderboards import Leaderboards
+from partition_store import build_partitioned, load_partitioned
+from router import merge
+from serialization import encode_json, records
+from shards import Shard
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(HERE, 'final.csv')
+MODEL_PATH = os.path.join(HERE, 'creator_recommendation_model.joblib')
+# As app.py returns them
+COLUMNS = ['youtuber', 'predicted_earning', 'subscribers', 'video_views', 'country', 'channel_type']
+TOP_K = 5
+BRIEFS = 300
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return load_catalog(DATA_PATH, MODEL_PATH, 'base')
+
+
+@pytest.fixture(scope='module')
+def briefs(catalog):
+    """(partition, budget, min_views): drawn from the data, log-uniform, and on and around the tree's cuts"""
+    rng = np.random.default_rng(0)
+    keys = sorted(catalog.partitions)
+    budgets = list(catalog.data['brand_budget_usd'].dropna()) + list(10 ** rng.uniform(1, 7, 200))
+    views = list(catalog.data['min_views_required'].dropna()) + list(10 ** rng.uniform(0, 9, 200))
+    for axis, cuts in enumerate(catalog.regions.thresholds):
+        edges = np.concatenate([cuts, np.nextafter(cuts, np.inf), np.nextafter(cuts, -np.inf)])
+        (budgets, views)[axis].extend(edges.tolist())
+    return [(keys[rng.integers(len(keys))], float(rng.choice(budgets)), float(rng.choice(views)))
+            for _ in range(BRIEFS)]
+
+
+def ranked(block, values, columns=COLUMNS, k=TOP_K):
+    candidates = block.assign(predicted_earning=values)
+    return records(candidates.sort_values(by='predicted_earning', ascending=False, kind='mergesort').head(k), columns)
+
+
+def expected(block, model, budget, min_views, columns=COLUMNS):
+    values = model.predict(block.assign(brand_budget_usd=budget, min_views_required=min_views)[FEATURES])
+    return ranked(block, values, columns)
+
+
+def answer(catalog, key, budget, min_views, columns=COLUMNS):
+    block = catalog.partitions.get(key)
+    if block is None:
+        return []
+    return ranked(block, catalog.regions.predict(key, budget, min_views), columns)
+
+
+def same(a, b):
+    # Compared as the client sees them; NaN view counts never equal themselves as floats
+    return encode_json(a) == encode_json(b)
+
+
+def test_compiled_tree_matches_model(catalog, briefs):
+    tree = CompiledTree(*export_model(catalog.model))
+    rng = np.random.default_rng(1)
+    frame = catalog.data.assign(
+        brand_budget_usd=rng.choice([budget for _, budget, _ in briefs], len(catalog.data)),
+        min_views_required=rng.choice([views for _, _, views in briefs], len(catalog.data)),
+    )[FEATURES]
+    assert np.array_equal(tree.predict(frame), np.asarray(catalog.model.predict(frame), dtype=np.float64))
+
+
+def test_regions_match_model(catalog, briefs):
+    for key, budget, min_views in briefs:
+        block = catalog.partitions[key]
+        values = block.assign(brand_budget_usd=budget, min_views_required=min_views)[FEATURES]
+        assert np.array_equal(catalog.regions.predict(key, budget, min_views), catalog.model.predict(values)), \
+            (key, budget, min_views)
+
+
+def test_regions_within_a_tiny_cap_match_model(catalog, briefs):
+    # Every build evicts the partition before it, so answers come from rebuilt regions
+    capped = Catalog(catalog.data, catalog.model, 'capped', regions_max_bytes=1)
+    for key, budget, min_views in briefs:
+        assert same(answer(capped, key, budget, min_views),
+                    expected(catalog.partitions[key], catalog.model, budget, min_views))
+    assert capped.regions.stats()['evictions'] > 0
+
+
+def test_leaderboards_match_on_demand(catalog, briefs):
+    min_views = sorted({0.0, briefs[0][2]})
+    boards = Leaderboards(COLUMNS, TOP_K, min_views=min_views)
+    boards.refresh(catalog)
+    for key, budget, _ in briefs[:100]:
+        for views in min_views:
+            board = boards.lookup(catalog, key, budget, views, TOP_K)
+            assert board is not None
+            assert same(board, expected(catalog.partitions[key], catalog.model, budget, views))
+
+
+def test_partitioned_store_matches_in_memory(catalog, briefs, tmp_path):
+    store = str(tmp_path / 'partitions')
+    build_partitioned(DATA_PATH, MODEL_PATH, store, chunk_rows=200)
+    # Room for a few partitions only, so lookups load, evict and reload
+    partitioned = load_partitioned(store, 100, 'partitioned')
+    assert sorted(partitioned.partitions) == sorted(catalog.partitions)
+    for key, budget, min_views in briefs:
+        assert same(answer(partitioned, key, budget, min_views), answer(catalog, key, budget, min_views))
+
+
+@pytest.mark.parametrize('by', ['country', 'creator'])
+def test_shards_merge_to_unsharded(catalog, briefs, by):
+    data, _ = read_dataset(DATA_PATH)
+    model = load_model(MODEL_PATH)
+    shards = [Catalog(Shard(index, 3, by).select(data), model, f'shard{index}') for index in range(3)]
+    for key, budget, min_views in briefs:
+        lists = [answer(shard, key, budget, min_views, COLUMNS + ['catalog_row']) for shard in shards]
+        assert same(merge(lists), answer(catalog, key, budget, min_views))
+
+
+def test_delta_applied_matches_reload(catalog, briefs):
+    names = catalog.data['youtuber']
+    entries = [
+        {"youtuber": names.iloc[0], "video_views_for_the_last_30_days": 1.0e5},
+        {"youtuber": names.iloc[1], "country": "India"},
+        {"op": "delete", "youtuber": names.iloc[2]},
+        {"youtuber": "New Creator", "subscribers": 5e7, "video_views": "12.5B", "country": "India",
+         "channel_type": "Music", "video_views_for_the_last_30_days": 9e8, "product_category": "Music"},
+        # Lines that cannot be applied are skipped, not retried forever
+        {"youtuber": names.iloc[3], "subscribers": [1]},
+        {"youtuber": names.iloc[4], "unknown_column": 1},
+    ]
+    lines = [json.dumps(entry).encode() for entry in entries]
+    derived = apply_entries(catalog, lines[:2], 10)
+    derived = apply_entries(derived, lines[2:], 20)
+    assert derived.deltas.rejected == 2
+    reloaded = Catalog(compacted_data(derived), catalog.model, 'reloaded')
+    assert sorted(derived.partitions) == sorted(reloaded.partitions)
+    assert derived.rows == reloaded.rows
+    for key, budget, min_views in briefs + [(key, 1e4, 1e3) for key in derived.changed]:
+        assert same(answer(derived, key, budget, min_views), answer(reloaded, key, budget, min_views))
+        if key in reloaded.partitions:
+            assert same(answer(reloaded, key, budget, min_views),
+                        expected(reloaded.partitions[key], catalog.model, budget, min_views))